@@ -6,19 +6,22 @@ This tool analyzes Azure DevOps pipelines for security vulnerabilities
 by examining YAML definitions, build logs, and execution traces.
 """
 
+from __future__ import annotations
+
 import argparse
 import logging
 import os
 import sys
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import TYPE_CHECKING, Dict, Any, List, Optional
 from dotenv import load_dotenv
 
 # Add src to path
 sys.path.append(str(Path(__file__).parent / 'src'))
 
-from src.utils.azure_client import AzureDevOpsClient
-from src.utils.security_analyzer import SecurityAnalyzer
+if TYPE_CHECKING:
+    from src.utils.azure_client import AzureDevOpsClient
+    from src.utils.security_analyzer import SecurityAnalyzer
 
 # Load .env file
 load_dotenv()
@@ -26,10 +29,9 @@ load_dotenv()
 # Get configuration from environment variables
 DEFINITION_ID = int(os.getenv('AZURE_DEFINITION_ID', '10'))
 LOG_LEVEL = os.getenv('AZURE_LOG_LEVEL', 'INFO')
+LOG_FETCH_WORKERS = int(os.getenv('AZURE_LOG_FETCH_WORKERS', '8'))
 LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 
-# Configure logging
-logging.basicConfig(level=getattr(logging, LOG_LEVEL), format=LOG_FORMAT)
 logger = logging.getLogger(__name__)
 
 def main():
@@ -66,31 +68,45 @@ def main():
     
     args = parser.parse_args()
     
+    # Configure logging
+    logging.basicConfig(level=getattr(logging, LOG_LEVEL), format=LOG_FORMAT)
     if args.verbose:
         logging.getLogger().setLevel(logging.DEBUG)
     
+    # Deferred so that --help and argument errors do not pay for requests and the analyzer
+    from src.utils.azure_client import AzureDevOpsClient
+    from src.utils.helpers import run_report
+    from src.utils.security_analyzer import SecurityAnalyzer
+    
+    # Compile security patterns once before analysis
+    SecurityAnalyzer.compile_patterns()
+    
     # Initialize Azure client
     client = AzureDevOpsClient()
     
     print("🔍 Azure DevOps Pipeline Security Analysis")
     print("=" * 50)
     
-    if args.analyze_yaml:
-        analyze_pipeline_yaml(client, args.definition_id)
+    # Default: run all analyses
+    run_all = not any([args.analyze_yaml, args.analyze_build, args.analyze_logs])
+    
+    if args.analyze_yaml or run_all:
+        run_report(analyze_pipeline_yaml, client, SecurityAnalyzer, args.definition_id)
     
-    if args.analyze_build:
-        analyze_latest_build(client, args.definition_id)
+    # The build and log analyses share the latest build and its timeline; fetch them once
+    latest_build = timeline = None
+    if args.analyze_build or args.analyze_logs or run_all:
+        latest_build = client.get_latest_build(args.definition_id)
+        if latest_build:
+            timeline = client.get_build_timeline(latest_build['id'])
     
-    if args.analyze_logs:
-        analyze_build_logs(client, args.definition_id)
+    if args.analyze_build or run_all:
+        run_report(analyze_latest_build, args.definition_id, latest_build, timeline)
     
-    if not any([args.analyze_yaml, args.analyze_build, args.analyze_logs]):
-        # Default: run all analyses
-        analyze_pipeline_yaml(client, args.definition_id)
-        analyze_latest_build(client, args.definition_id)
-        analyze_build_logs(client, args.definition_id)
+    if args.analyze_logs or run_all:
+        run_report(analyze_build_logs, client, SecurityAnalyzer, args.definition_id, latest_build, timeline)
 
-def analyze_pipeline_yaml(client: AzureDevOpsClient, definition_id: int):
+def analyze_pipeline_yaml(client: AzureDevOpsClient, analyzer: type[SecurityAnalyzer], definition_id: int):
     """Analyze pipeline YAML definition"""
     print(f"\n📋 Pipeline YAML Analizi (Definition ID: {definition_id})")
     print("-" * 40)
@@ -111,6 +127,7 @@ def analyze_pipeline_yaml(client: AzureDevOpsClient, definition_id: int):
         print(f"\n📊 Pipeline Adımları ({len(phases)} adet):")
         
         security_issues = []
+        analysis_cache = {}  # Script text -> analysis, steps often repeat the same script
         for i, phase in enumerate(phases, 1):
             print(f"\n  {i}. Phase: {phase.get('name', 'Bilinmiyor')}")
             
@@ -122,8 +139,11 @@ def analyze_pipeline_yaml(client: AzureDevOpsClient, definition_id: int):
                     
                     # Check for dangerous inputs
                     for key, value in inputs.items():
-                        if isinstance(value, str):
-                            analysis = SecurityAnalyzer.analyze_script_content(value)
+                        if isinstance(value, str) and value.strip():
+                            analysis = analysis_cache.get(value)
+                            if analysis is None:
+                                analysis = analyzer.analyze_script_content(value)
+                                analysis_cache[value] = analysis
                             if analysis['has_dangerous_patterns']:
                                 security_issues.append({
                                     'step': display_name,
@@ -141,12 +161,12 @@ def analyze_pipeline_yaml(client: AzureDevOpsClient, definition_id: int):
         else:
             print("\n✅ Güvenlik sorunu bulunamadı")
 
-def analyze_latest_build(client: AzureDevOpsClient, definition_id: int):
+def analyze_latest_build(definition_id: int, latest_build: Optional[Dict[str, Any]],
+                         timeline: Optional[Dict[str, Any]]):
     """Analyze latest build"""
     print(f"\n🔍 Son Build Analizi (Definition ID: {definition_id})")
     print("-" * 40)
     
-    latest_build = client.get_latest_build(definition_id)
     if not latest_build:
         print("❌ Son build bulunamadı")
         return
@@ -159,8 +179,6 @@ def analyze_latest_build(client: AzureDevOpsClient, definition_id: int):
     print(f"🎯 Sonuç: {result}")
     print(f"🆔 Build ID: {build_id}")
     
-    # Get timeline
-    timeline = client.get_build_timeline(build_id)
     if timeline:
         records = timeline.get('records', [])
         task_steps = [r for r in records if r.get('type') == 'Task']
@@ -171,19 +189,17 @@ def analyze_latest_build(client: AzureDevOpsClient, definition_id: int):
             result = step.get('result', 'Bilinmiyor')
             print(f"  {i}. {name} - {result}")
 
-def analyze_build_logs(client: AzureDevOpsClient, definition_id: int):
+def analyze_build_logs(client: AzureDevOpsClient, analyzer: type[SecurityAnalyzer], definition_id: int,
+                       latest_build: Optional[Dict[str, Any]], timeline: Optional[Dict[str, Any]]):
     """Analyze build logs for security issues"""
     print(f"\n📜 Build Log Analizi (Definition ID: {definition_id})")
     print("-" * 40)
     
-    latest_build = client.get_latest_build(definition_id)
     if not latest_build:
         print("❌ Son build bulunamadı")
         return
     
     build_id = latest_build['id']
-    timeline = client.get_build_timeline(build_id)
-    
     if not timeline:
         print("❌ Timeline alınamadı")
         return
@@ -191,17 +207,23 @@ def analyze_build_logs(client: AzureDevOpsClient, definition_id: int):
     records = timeline.get('records', [])
     security_issues = []
     
+    log_ids = []
     for record in records:
         if record.get('type') == 'Task':
             log_info = record.get('log')
             if log_info and isinstance(log_info, dict):
                 log_id = log_info.get('id')
                 if log_id:
-                    log_content = client.get_log_content(build_id, log_id)
-                    if log_content:
-                        analysis = SecurityAnalyzer.analyze_log_content(log_content)
-                        if analysis['script_blocks']:
-                            security_issues.extend(analysis['script_blocks'])
+                    log_ids.append(log_id)
+    
+    # Fetch logs concurrently; each request is an independent HTTP round-trip
+    log_contents = client.get_all_logs(build_id, log_ids, max_workers=LOG_FETCH_WORKERS)
+    
+    for log_content in log_contents:
+        if log_content:
+            analysis = analyzer.analyze_log_content(log_content)
+            if analysis['script_blocks']:
+                security_issues.extend(analysis['script_blocks'])
     
     if security_issues:
         print(f"⚠️  Güvenlik Sorunları ({len(security_issues)} adet):")
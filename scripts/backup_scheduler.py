@@ -15,30 +15,42 @@ sys.path.append(str(Path(__file__).parent.parent))
 from src.utils.backup_manager import backup_manager
 from src.utils.log_manager import log_manager
 
-def daily_backup():
-    """Creates daily backup"""
+def report_backup(future, label, backup_type):
+    """Report the result of a background backup"""
     try:
-        print(f"\n🔄 Starting daily backup... ({datetime.now()})")
-        
-        result = backup_manager.create_backup(
-            backup_type="daily",
-            description=f"Daily automatic backup - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        )
+        result = future.result()
         
         if result["success"]:
-            print(f"✅ Daily backup completed: {result['backup_name']}")
+            print(f"✅ {label} backup completed: {result['backup_name']}")
             log_manager.log_audit(
-                "Daily backup completed",
+                f"{label} backup completed",
                 backup_name=result['backup_name'],
-                backup_type="daily"
+                backup_type=backup_type
             )
         else:
-            print(f"❌ Daily backup error: {result['error']}")
+            print(f"❌ {label} backup error: {result['error']}")
             log_manager.log_error(
-                "Daily backup error",
+                f"{label} backup error",
                 error=result['error']
             )
             
+    except Exception as e:
+        error_msg = f"{label} backup exception: {e}"
+        print(f"❌ {error_msg}")
+        log_manager.log_error(error_msg)
+
+def daily_backup():
+    """Creates daily backup"""
+    try:
+        print(f"\n🔄 Starting daily backup... ({datetime.now()})")
+        
+        # Runs on the backup worker, so the scheduler keeps running jobs during a long backup
+        future = backup_manager.create_backup_async(
+            backup_type="daily",
+            description=f"Daily automatic backup - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+        )
+        future.add_done_callback(lambda done: report_backup(done, "Daily", "daily"))
+            
     except Exception as e:
         error_msg = f"Daily backup exception: {e}"
         print(f"❌ {error_msg}")
@@ -49,24 +61,12 @@ def weekly_backup():
     try:
         print(f"\n🔄 Starting weekly backup... ({datetime.now()})")
         
-        result = backup_manager.create_backup(
+        # Queued behind a daily backup still running; the worker runs one backup at a time
+        future = backup_manager.create_backup_async(
             backup_type="weekly",
             description=f"Weekly automatic backup - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
         )
-        
-        if result["success"]:
-            print(f"✅ Weekly backup completed: {result['backup_name']}")
-            log_manager.log_audit(
-                "Weekly backup completed",
-                backup_name=result['backup_name'],
-                backup_type="weekly"
-            )
-        else:
-            print(f"❌ Weekly backup error: {result['error']}")
-            log_manager.log_error(
-                "Weekly backup error",
-                error=result['error']
-            )
+        future.add_done_callback(lambda done: report_backup(done, "Weekly", "weekly"))
             
     except Exception as e:
         error_msg = f"Weekly backup exception: {e}"
@@ -123,7 +123,14 @@ def run_scheduler():
     try:
         while True:
             schedule.run_pending()
-            time.sleep(60)  # Check every minute
+            
+            # Sleep until the next scheduled job
+            idle_seconds = schedule.idle_seconds()
+            if idle_seconds is None:
+                print("⏹️ No scheduled jobs left!")
+                break
+            if idle_seconds > 0:
+                time.sleep(idle_seconds)
             
     except KeyboardInterrupt:
         print("\n⏹️ Scheduler stopped!")
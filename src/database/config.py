@@ -21,6 +21,16 @@ DATABASE_CONFIG = {
     "echo": False,  # SQL queries logging
     "pool_pre_ping": True,
     "pool_recycle": 3600,
+    "connect_args": {"check_same_thread": False},
+}
+
+# SQLite pragmas applied to every new connection
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",  # Concurrent readers during writes
+    "synchronous": "NORMAL",  # Safe with WAL, fewer fsyncs per commit
+    "temp_store": "MEMORY",
+    "mmap_size": 268435456,  # 256MB
+    "cache_size": -65536,  # 64MB
 }
 
 # Logging configuration
@@ -4,22 +4,59 @@ Database manager for pipeline security analysis
 
 import logging
 import json
+from collections import Counter
+from contextlib import contextmanager
 from datetime import datetime
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event, exists, insert, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import sessionmaker, scoped_session, defer
 from sqlalchemy.exc import SQLAlchemyError
 
-from .config import DATABASE_URL, DATABASE_CONFIG
+from ..utils.helpers import orjson
+from .config import DATABASE_URL, DATABASE_CONFIG, SQLITE_PRAGMAS
 from .models import Base, WebhookEvent, SecurityFinding, PipelineAnalysis, PatternStatistic
 
 logger = logging.getLogger(__name__)
 
+# INSERT ... RETURNING id, compiled once and reused for every webhook event
+_INSERT_WEBHOOK_EVENT = insert(WebhookEvent).returning(WebhookEvent.id)
+
+def _json_dumps(obj):
+    """Serialize obj to a JSON string, using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj)
+
+# Risk score per pattern
+_RISK_SCORES = {
+    'eval': 10.0,
+    'exec': 10.0,
+    'base64_execute': 9.0,
+    'powershell_invoke': 8.0,
+    'subprocess_call': 7.0,
+    'curl_dangerous': 6.0,
+    'file_write': 5.0,
+    'base64_encoded': 3.0
+}
+
+# Severity per pattern
+_SEVERITY = {
+    'eval': 'CRITICAL',
+    'exec': 'CRITICAL',
+    'base64_execute': 'CRITICAL',
+    'powershell_invoke': 'CRITICAL',
+    'subprocess_call': 'HIGH',
+    'curl_dangerous': 'HIGH',
+    'file_write': 'HIGH'
+}
+
 class DatabaseManager:
     """Database operations manager class"""
     
     def __init__(self):
         self.engine = None
         self.SessionLocal = None
+        self.Session = None
         self._initialize_database()
     
     def _initialize_database(self):
@@ -27,221 +64,279 @@ class DatabaseManager:
         try:
             # Create engine
             self.engine = create_engine(DATABASE_URL, **DATABASE_CONFIG)
+            event.listen(self.engine, "connect", self._apply_sqlite_pragmas)
             
             # Create session factory
-            self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+            self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=self.engine)
+            self.Session = scoped_session(self.SessionLocal)
             
             # Create tables
             Base.metadata.create_all(bind=self.engine)
             
+            # Create indexes missing from databases created before they were declared
+            for index in WebhookEvent.__table__.indexes:
+                index.create(bind=self.engine, checkfirst=True)
+            
+            self._backfill_pattern_statistics()
+            
             logger.info("✅ Database successfully initialized")
             
         except Exception as e:
             logger.error(f"❌ Database initialization error: {e}")
             raise
     
+    @staticmethod
+    def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+        """Apply SQLite pragmas to a new connection"""
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma, value in SQLITE_PRAGMAS.items():
+                cursor.execute(f"PRAGMA {pragma}={value}")
+        finally:
+            cursor.close()
+    
     def get_session(self):
         """Return database session"""
         return self.SessionLocal()
     
+    @contextmanager
+    def _session(self):
+        """Provide a scoped session that commits on success and rolls back on error"""
+        session = self.Session()
+        try:
+            yield session
+            session.commit()
+        except SQLAlchemyError:
+            session.rollback()
+            raise
+        finally:
+            self.Session.remove()
+    
+    def _insert_webhook_event(self, session, event_data, processed=False):
+        """Insert webhook event and return its id in the same statement"""
+        return session.execute(_INSERT_WEBHOOK_EVENT, {
+            'event_type': event_data['event_type'],
+            'build_id': event_data['build_id'],
+            'build_number': event_data['build_number'],
+            'definition_id': event_data['definition_id'],
+            'definition_name': event_data['definition_name'],
+            'raw_data': _json_dumps(event_data.get('raw_data', {})),
+            'processed': processed
+        }).scalar_one()
+    
+    def _insert_security_findings(self, session, webhook_event_id, findings):
+        """Insert security findings with a single executemany statement"""
+        if not findings:
+            return
+        
+        rows = [
+            {
+                'webhook_event_id': webhook_event_id,
+                'pattern_name': finding['pattern'],
+                'pattern_count': finding['count'],
+                'risk_score': self._calculate_risk_score(finding['pattern']),
+                'examples': _json_dumps(finding['matches'][:3]),  # First 3 examples
+                'severity': self._determine_severity(finding['pattern'])
+            }
+            for finding in findings
+        ]
+        session.execute(insert(SecurityFinding), rows)
+        self._update_pattern_statistics(session, rows)
+    
+    def _update_pattern_statistics(self, session, rows):
+        """Increment pattern statistics for newly inserted findings"""
+        now = datetime.utcnow()
+        occurrences = Counter(row['pattern_name'] for row in rows)
+        
+        stmt = sqlite_insert(PatternStatistic).values([
+            {
+                'pattern_name': pattern_name,
+                'total_occurrences': count,
+                'last_seen': now,
+                'risk_level': self._determine_severity(pattern_name)
+            }
+            for pattern_name, count in occurrences.items()
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['pattern_name'],
+            set_={
+                'total_occurrences': PatternStatistic.total_occurrences + stmt.excluded.total_occurrences,
+                'last_seen': stmt.excluded.last_seen
+            }
+        )
+        session.execute(stmt)
+    
+    def _backfill_pattern_statistics(self):
+        """Populate pattern statistics from findings saved before they were maintained"""
+        with self._session() as session:
+            if session.query(PatternStatistic.id).limit(1).scalar() is not None:
+                return
+            
+            result = session.execute(text("""
+                SELECT 
+                    pattern_name,
+                    COUNT(*) as total_occurrences,
+                    MAX(timestamp) as last_seen
+                FROM security_findings 
+                GROUP BY pattern_name
+            """)).all()
+            
+            for row in result:
+                session.add(PatternStatistic(
+                    pattern_name=row.pattern_name,
+                    total_occurrences=row.total_occurrences,
+                    last_seen=datetime.fromisoformat(row.last_seen) if row.last_seen else None,
+                    risk_level=self._determine_severity(row.pattern_name)
+                ))
+    
     def save_webhook_event(self, event_data):
         """Save webhook event"""
         try:
-            session = self.get_session()
-            
-            # Create event
-            webhook_event = WebhookEvent(
-                event_type=event_data['event_type'],
-                build_id=event_data['build_id'],
-                build_number=event_data['build_number'],
-                definition_id=event_data['definition_id'],
-                definition_name=event_data['definition_name'],
-                raw_data=json.dumps(event_data.get('raw_data', {})),
-                processed=False
-            )
-            
-            session.add(webhook_event)
-            session.commit()
+            with self._session() as session:
+                webhook_event_id = self._insert_webhook_event(session, event_data)
             
-            logger.info(f"✅ Webhook event saved: {webhook_event.build_number}")
-            return webhook_event.id
+            logger.info(f"✅ Webhook event saved: {event_data['build_number']}")
+            return webhook_event_id
             
         except SQLAlchemyError as e:
             logger.error(f"❌ Webhook event save error: {e}")
-            session.rollback()
             raise
-        finally:
-            session.close()
     
     def save_security_findings(self, webhook_event_id, findings):
         """Save security findings"""
         try:
-            session = self.get_session()
+            with self._session() as session:
+                self._insert_security_findings(session, webhook_event_id, findings)
             
-            for finding in findings:
-                security_finding = SecurityFinding(
-                    webhook_event_id=webhook_event_id,
-                    pattern_name=finding['pattern'],
-                    pattern_count=finding['count'],
-                    risk_score=self._calculate_risk_score(finding['pattern']),
-                    examples=json.dumps(finding['matches'][:3]),  # First 3 examples
-                    severity=self._determine_severity(finding['pattern'])
-                )
-                
-                session.add(security_finding)
-            
-            session.commit()
             logger.info(f"✅ {len(findings)} security findings saved")
             
         except SQLAlchemyError as e:
             logger.error(f"❌ Security findings save error: {e}")
-            session.rollback()
             raise
-        finally:
-            session.close()
     
     def save_pipeline_analysis(self, webhook_event_id, yaml_content, yaml_filename, total_patterns, total_risk_score):
         """Save pipeline analysis results"""
         try:
-            session = self.get_session()
-            
-            pipeline_analysis = PipelineAnalysis(
-                webhook_event_id=webhook_event_id,
-                yaml_content=yaml_content,
-                yaml_filename=yaml_filename,
-                total_patterns_found=total_patterns,
-                total_risk_score=total_risk_score,
-                analysis_status='SUCCESS'
-            )
-            
-            session.add(pipeline_analysis)
-            session.commit()
+            with self._session() as session:
+                session.add(PipelineAnalysis(
+                    webhook_event_id=webhook_event_id,
+                    yaml_content=yaml_content,
+                    yaml_filename=yaml_filename,
+                    total_patterns_found=total_patterns,
+                    total_risk_score=total_risk_score,
+                    analysis_status='SUCCESS'
+                ))
             
             logger.info(f"✅ Pipeline analysis saved")
             
         except SQLAlchemyError as e:
             logger.error(f"❌ Pipeline analysis save error: {e}")
-            session.rollback()
             raise
-        finally:
-            session.close()
+    
+    def record_analysis(self, event, findings, analysis):
+        """Save webhook event, security findings and pipeline analysis in one transaction"""
+        try:
+            with self._session() as session:
+                webhook_event_id = self._insert_webhook_event(session, event, processed=True)
+                
+                self._insert_security_findings(session, webhook_event_id, findings)
+                session.add(PipelineAnalysis(
+                    webhook_event_id=webhook_event_id,
+                    yaml_content=analysis['yaml_content'],
+                    yaml_filename=analysis['yaml_filename'],
+                    total_patterns_found=analysis['total_patterns'],
+                    total_risk_score=analysis['total_risk_score'],
+                    analysis_status='SUCCESS'
+                ))
+            
+            logger.info(f"✅ Analysis recorded: {event['build_number']} ({len(findings)} findings)")
+            return webhook_event_id
+            
+        except SQLAlchemyError as e:
+            logger.error(f"❌ Analysis record error: {e}")
+            raise
     
     def update_webhook_event_processed(self, webhook_event_id):
         """Mark webhook event as processed"""
         try:
-            session = self.get_session()
-            
-            event = session.query(WebhookEvent).filter(WebhookEvent.id == webhook_event_id).first()
-            if event:
-                event.processed = True
-                session.commit()
-                logger.info(f"✅ Webhook event marked as processed: {event.build_number}")
+            with self._session() as session:
+                # Only the flag changes; the payload is never read here
+                event = session.query(WebhookEvent).options(defer(WebhookEvent.raw_data)).filter(
+                    WebhookEvent.id == webhook_event_id
+                ).first()
+                if event:
+                    event.processed = True
+                    logger.info(f"✅ Webhook event marked as processed: {event.build_number}")
             
         except SQLAlchemyError as e:
             logger.error(f"❌ Webhook event update error: {e}")
-            session.rollback()
             raise
-        finally:
-            session.close()
     
     def get_recent_events(self, limit=10):
         """Get recent events"""
         try:
-            session = self.get_session()
-            
-            events = session.query(WebhookEvent).order_by(WebhookEvent.timestamp.desc()).limit(limit).all()
-            return events
+            with self._session() as session:
+                return session.query(WebhookEvent).order_by(WebhookEvent.timestamp.desc()).limit(limit).all()
             
         except SQLAlchemyError as e:
             logger.error(f"❌ Get events error: {e}")
             return []
-        finally:
-            session.close()
     
     def get_security_findings_by_event(self, webhook_event_id):
         """Get security findings for event"""
         try:
-            session = self.get_session()
-            
-            findings = session.query(SecurityFinding).filter(
-                SecurityFinding.webhook_event_id == webhook_event_id
-            ).all()
-            
-            return findings
+            with self._session() as session:
+                return session.query(SecurityFinding).filter(
+                    SecurityFinding.webhook_event_id == webhook_event_id
+                ).all()
             
         except SQLAlchemyError as e:
             logger.error(f"❌ Get security findings error: {e}")
             return []
-        finally:
-            session.close()
     
-    def get_pattern_statistics(self):
-        """Get pattern statistics"""
+    def get_pattern_statistics(self, limit=None, offset=0):
+        """Get pattern statistics, most frequent first"""
         try:
-            session = self.get_session()
-            
-            # Group and count patterns
-            result = session.execute(text("""
-                SELECT 
-                    pattern_name,
-                    COUNT(*) as total_occurrences,
-                    MAX(timestamp) as last_seen,
-                    AVG(risk_score) as avg_risk_score
-                FROM security_findings 
-                GROUP BY pattern_name 
-                ORDER BY total_occurrences DESC
-            """))
-            
-            return [dict(row) for row in result]
+            with self._session() as session:
+                # Plain column rows; no ORM entities are built
+                query = session.query(
+                    PatternStatistic.pattern_name,
+                    PatternStatistic.total_occurrences,
+                    PatternStatistic.last_seen
+                ).order_by(PatternStatistic.total_occurrences.desc()).offset(offset)
+                if limit is not None:
+                    query = query.limit(limit)
+                
+                return [
+                    {
+                        **row._mapping,
+                        'avg_risk_score': self._calculate_risk_score(row.pattern_name)
+                    }
+                    for row in query
+                ]
             
         except SQLAlchemyError as e:
             logger.error(f"❌ Get pattern statistics error: {e}")
             return []
-        finally:
-            session.close()
     
     def _calculate_risk_score(self, pattern_name):
         """Calculate risk score for pattern"""
-        risk_scores = {
-            'eval': 10.0,
-            'exec': 10.0,
-            'base64_execute': 9.0,
-            'powershell_invoke': 8.0,
-            'subprocess_call': 7.0,
-            'curl_dangerous': 6.0,
-            'file_write': 5.0,
-            'base64_encoded': 3.0
-        }
-        
-        return risk_scores.get(pattern_name, 5.0)
+        return _RISK_SCORES.get(pattern_name, 5.0)
     
     def _determine_severity(self, pattern_name):
         """Determine severity for pattern"""
-        high_risk_patterns = ['eval', 'exec', 'base64_execute', 'powershell_invoke']
-        medium_risk_patterns = ['subprocess_call', 'curl_dangerous', 'file_write']
-        
-        if pattern_name in high_risk_patterns:
-            return 'CRITICAL'
-        elif pattern_name in medium_risk_patterns:
-            return 'HIGH'
-        else:
-            return 'MEDIUM'
+        return _SEVERITY.get(pattern_name, 'MEDIUM')
     
     def event_exists(self, build_id, build_number):
         """Check if event was previously saved"""
         try:
-            session = self.get_session()
-            
-            # Check with build ID and build number
-            existing_event = session.query(WebhookEvent).filter(
-                WebhookEvent.build_id == build_id,
-                WebhookEvent.build_number == build_number
-            ).first()
-            
-            return existing_event is not None
+            with self._session() as session:
+                # EXISTS stops at the first matching index entry without loading a row
+                return session.query(exists().where(
+                    WebhookEvent.build_id == build_id,
+                    WebhookEvent.build_number == build_number
+                )).scalar()
             
         except SQLAlchemyError as e:
             logger.error(f"❌ Event check error: {e}")
-            return False
-        finally:
-            session.close() 
\ No newline at end of file
+            return False
\ No newline at end of file
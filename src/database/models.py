@@ -2,7 +2,7 @@
 Database models for pipeline security analysis
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Boolean, Float, ForeignKey, JSON
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Boolean, Float, ForeignKey, JSON, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
@@ -13,6 +13,10 @@ Base = declarative_base()
 class WebhookEvent(Base):
     """Stores webhook events"""
     __tablename__ = 'webhook_events'
+    __table_args__ = (
+        Index('ix_webhook_build', 'build_id', 'build_number'),
+        Index('ix_webhook_ts', 'timestamp'),
+    )
     
     id = Column(Integer, primary_key=True)
     event_type = Column(String(50), nullable=False)
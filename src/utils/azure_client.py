@@ -1,11 +1,15 @@
-import requests
 from requests.auth import HTTPBasicAuth
 import json
 import logging
 import os
-from typing import Optional, Dict, Any
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List
 from dotenv import load_dotenv
 
+from .helpers import REQUEST_TIMEOUT, create_session
+
 # Load .env file
 load_dotenv()
 
@@ -13,6 +17,9 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Build logs kept in memory per client; the least recently used are dropped beyond this
+MAX_CACHED_LOGS = 256
+
 class AzureDevOpsClient:
     """Azure DevOps API client for pipeline analysis"""
     
@@ -26,17 +33,53 @@ class AzureDevOpsClient:
         
         self.auth = HTTPBasicAuth('', self.pat)
         self.base_url = f'{self.devops_server_url}/{self.organization}/{self.project}'
+        
+        # Shared session keeps connections (and TLS handshakes) alive between calls
+        self.session = create_session(self.auth)
+        
+        # Build logs never change once written: (build_id, log_id) -> text, in LRU order
+        self._log_cache = OrderedDict()
+        self._log_cache_lock = threading.Lock()
+        
+        # Conditional GET cache for definitions and timelines: url -> (etag, json)
+        self._etag_cache = {}
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def close(self):
+        """Close pooled connections"""
+        self.session.close()
+    
+    def _get_json_cached(self, url: str):
+        """GET JSON, revalidating a previously seen response with If-None-Match"""
+        cached = self._etag_cache.get(url)
+        headers = {'If-None-Match': cached[0]} if cached else None
+        
+        response = self.session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 304 and cached:
+            return 200, cached[1]
+        if response.status_code == 200:
+            data = response.json()
+            etag = response.headers.get('ETag')
+            if etag:
+                self._etag_cache[url] = (etag, data)
+            return 200, data
+        return response.status_code, None
     
     def get_pipeline_definition(self, definition_id: int) -> Optional[Dict[str, Any]]:
         """Get pipeline YAML definition"""
         url = f'{self.base_url}/_apis/build/definitions/{definition_id}?api-version={self.api_version}'
         
         try:
-            response = requests.get(url, auth=self.auth)
-            if response.status_code == 200:
-                return response.json()
+            status_code, definition = self._get_json_cached(url)
+            if status_code == 200:
+                return definition
             else:
-                logger.error(f"Pipeline definition failed: {response.status_code}")
+                logger.error(f"Pipeline definition failed: {status_code}")
                 return None
         except Exception as e:
             logger.error(f"Error getting pipeline definition: {e}")
@@ -47,7 +90,7 @@ class AzureDevOpsClient:
         url = f'{self.base_url}/_apis/build/builds?definitions={definition_id}&$top=1&api-version={self.api_version}'
         
         try:
-            response = requests.get(url, auth=self.auth)
+            response = self.session.get(url, timeout=REQUEST_TIMEOUT)
             if response.status_code == 200:
                 builds = response.json().get('value', [])
                 return builds[0] if builds else None
@@ -63,11 +106,11 @@ class AzureDevOpsClient:
         url = f'{self.base_url}/_apis/build/builds/{build_id}/timeline?api-version={self.api_version}'
         
         try:
-            response = requests.get(url, auth=self.auth)
-            if response.status_code == 200:
-                return response.json()
+            status_code, timeline = self._get_json_cached(url)
+            if status_code == 200:
+                return timeline
             else:
-                logger.error(f"Get build timeline failed: {response.status_code}")
+                logger.error(f"Get build timeline failed: {status_code}")
                 return None
         except Exception as e:
             logger.error(f"Error getting build timeline: {e}")
@@ -75,11 +118,23 @@ class AzureDevOpsClient:
     
     def get_log_content(self, build_id: int, log_id: int) -> Optional[str]:
         """Get log content"""
+        key = (build_id, log_id)
+        with self._log_cache_lock:
+            cached = self._log_cache.get(key)
+            if cached is not None:
+                self._log_cache.move_to_end(key)
+                return cached
+        
         url = f'{self.base_url}/_apis/build/builds/{build_id}/logs/{log_id}?api-version={self.api_version}'
         
         try:
-            response = requests.get(url, auth=self.auth)
+            response = self.session.get(url, timeout=REQUEST_TIMEOUT)
             if response.status_code == 200:
+                with self._log_cache_lock:
+                    self._log_cache[key] = response.text
+                    self._log_cache.move_to_end(key)
+                    if len(self._log_cache) > MAX_CACHED_LOGS:
+                        self._log_cache.popitem(last=False)
                 return response.text
             else:
                 logger.error(f"Get log content failed: {response.status_code}")
@@ -88,12 +143,18 @@ class AzureDevOpsClient:
             logger.error(f"Error getting log content: {e}")
             return None
     
+    def get_all_logs(self, build_id: int, log_ids: List[int], max_workers: int = 8) -> List[Optional[str]]:
+        """Get several logs of a build concurrently, in log_ids order"""
+        # Requests overlap on the pooled session; wall time is ~ the slowest log
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(lambda log_id: self.get_log_content(build_id, log_id), log_ids))
+    
     def get_build_details(self, build_id: int) -> Optional[Dict[str, Any]]:
         """Get build details"""
         url = f'{self.base_url}/_apis/build/builds/{build_id}?api-version={self.api_version}'
         
         try:
-            response = requests.get(url, auth=self.auth)
+            response = self.session.get(url, timeout=REQUEST_TIMEOUT)
             if response.status_code == 200:
                 return response.json()
             else:
@@ -124,7 +185,7 @@ class AzureDevOpsClient:
             # Get YAML file content
             url = f'{self.base_url}/_apis/git/repositories/{repo_id}/items?path={yaml_filename}&api-version={self.api_version}'
             
-            response = requests.get(url, auth=self.auth)
+            response = self.session.get(url, timeout=REQUEST_TIMEOUT)
             if response.status_code == 200:
                 return response.text
             else:
@@ -0,0 +1,64 @@
+"""
+Shared helpers: HTTP sessions, optional orjson and report output
+"""
+
+import io
+import sys
+from contextlib import redirect_stdout
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:  # Optional: callers fall back to the standard library json module
+    orjson = None
+
+# (connect, read) timeouts in seconds for Azure DevOps and Slack calls
+REQUEST_TIMEOUT = (3.05, 30)
+
+# Responses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+def create_session(auth=None, pool_connections=10, pool_maxsize=20, retries=3, backoff_factor=0.3,
+                   allowed_methods=Retry.DEFAULT_ALLOWED_METHODS):
+    """Create a session with pooled keep-alive connections and retries"""
+    session = requests.Session()
+    session.auth = auth
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=allowed_methods,
+            raise_on_status=False  # Hand the last response back to the caller's status checks
+        )
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+class SocketIOJson:
+    """orjson behind the json module interface python-socketio uses to encode and decode packets"""
+    
+    @staticmethod
+    def dumps(obj, **kwargs):
+        # orjson output is already compact, matching the separators socketio asks for
+        return orjson.dumps(obj).decode('utf-8')
+    
+    @staticmethod
+    def loads(data, **kwargs):
+        return orjson.loads(data)
+
+def run_report(analysis, *args):
+    """Run an analysis and write its printed report to stdout in one call"""
+    buffer = io.StringIO()
+    try:
+        with redirect_stdout(buffer):
+            analysis(*args)
+    finally:
+        sys.stdout.write(buffer.getvalue())
+        sys.stdout.flush()
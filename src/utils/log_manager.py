@@ -3,12 +3,130 @@
 Log Manager - Categorized logging system
 """
 
+import atexit
 import logging
 import logging.handlers
+import os
+import queue
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, Any
 
+# Maximum queued records written per batch by the log listener
+LOG_BATCH_SIZE = 256
+
+# Log categories: (logger name, level, file name, max bytes, backup count, echo to console)
+LOG_CATEGORIES = (
+    ('webhook_events', logging.INFO, 'webhook_events.log', 50*1024*1024, 10, True),  # 50MB
+    ('security_alerts', logging.WARNING, 'security_alerts.log', 20*1024*1024, 5, True),  # 20MB
+    ('database_operations', logging.INFO, 'database_operations.log', 10*1024*1024, 3, True),  # 10MB
+    ('errors', logging.ERROR, 'errors.log', 5*1024*1024, 2, True),  # 5MB
+    ('audit', logging.INFO, 'audit.log', 10*1024*1024, 3, False)  # 10MB
+)
+
+class BatchRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Rotating file handler that can write several records with one write and flush"""
+    
+    def _open(self):
+        """Open the log file and note whether it is a regular file"""
+        stream = super()._open()
+        # Only regular files are ever rotated (bpo-45401); this cannot change while open
+        self._is_regular_file = os.path.isfile(self.baseFilename)
+        return stream
+    
+    def _file_size(self):
+        """Size of the open log file, or None when it is never rotated"""
+        if not self._is_regular_file or self.maxBytes <= 0:
+            return None
+        # Size of the open file itself, so writes by other handlers or processes are counted too
+        return os.fstat(self.stream.fileno()).st_size
+    
+    def _would_exceed(self, size, text_bytes):
+        """Check whether writing text_bytes more would take the file past maxBytes"""
+        # An empty file takes any record; rotating it would only leave an empty backup
+        return size is not None and size > 0 and size + text_bytes >= self.maxBytes
+    
+    def shouldRollover(self, record):
+        """Determine if rollover should occur, from the open file's size"""
+        if self.stream is None:
+            self.stream = self._open()
+        text = self.format(record) + self.terminator
+        return self._would_exceed(self._file_size(), len(text.encode(self.stream.encoding, 'replace')))
+    
+    def emit(self, record):
+        """Write a single record"""
+        self._write_records([record])
+    
+    def emit_batch(self, records):
+        """Write records as a single chunk, checking rotation once per batch"""
+        records = [record for record in records if record.levelno >= self.level and self.filter(record)]
+        if not records:
+            return
+        
+        self.acquire()
+        try:
+            self._write_records(records)
+        finally:
+            self.release()
+    
+    def _write_records(self, records):
+        """Write and flush the formatted records, rotating wherever the next one would not fit"""
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+            size = self._file_size()
+            pending = []
+            for record in records:
+                text = self.format(record) + self.terminator
+                if size is not None:
+                    text_bytes = len(text.encode(self.stream.encoding, 'replace'))
+                    if self._would_exceed(size, text_bytes):
+                        # Records that fit go to the current file, the rest of the batch to the new one
+                        self.stream.write(''.join(pending))
+                        pending = []
+                        self.doRollover()
+                        if self.stream is None:
+                            self.stream = self._open()
+                        size = self._file_size()
+                    size += text_bytes
+                pending.append(text)
+            self.stream.write(''.join(pending))
+            self.stream.flush()
+        except Exception:
+            self.handleError(records[0])
+
+class BatchQueueListener(logging.handlers.QueueListener):
+    """Queue listener that drains pending records and hands them to handlers in batches"""
+    
+    def _monitor(self):
+        """Wait for a record, then take whatever else is already queued"""
+        while True:
+            batch = [self.dequeue(True)]
+            while len(batch) < LOG_BATCH_SIZE and batch[-1] is not self._sentinel:
+                try:
+                    batch.append(self.dequeue(False))
+                except queue.Empty:
+                    break
+            
+            stopping = batch[-1] is self._sentinel
+            if stopping:
+                batch.pop()
+            if batch:
+                self.handle_batch(batch)
+            if stopping:
+                break
+    
+    def handle_batch(self, records):
+        """Offer a batch of records to every handler"""
+        records = [self.prepare(record) for record in records]
+        for handler in self.handlers:
+            if hasattr(handler, 'emit_batch'):
+                handler.emit_batch(records)
+                continue
+            for record in records:
+                if not self.respect_handler_level or record.levelno >= handler.level:
+                    handler.handle(record)
+
 class LogManager:
     """Categorized log management"""
     
@@ -21,148 +139,76 @@ class LogManager:
         self.log_dir = Path(__file__).parent.parent.parent / "logs"
         self.log_dir.mkdir(exist_ok=True)
         
+        # Category loggers, looked up once
+        self._webhook_logger = logging.getLogger('webhook_events')
+        self._security_logger = logging.getLogger('security_alerts')
+        self._db_logger = logging.getLogger('database_operations')
+        self._error_logger = logging.getLogger('errors')
+        self._audit_logger = logging.getLogger('audit')
+        
+        # Loggers only enqueue records; one listener thread writes them in batches
+        self._queue = queue.SimpleQueue()
+        self._handlers = []
+        
         # Setup formatters
         detailed_formatter = logging.Formatter(
             '%(asctime)s | %(levelname)s | %(name)s | %(message)s',
             datefmt='%Y-%m-%d %H:%M:%S'
         )
         
-        # Webhook events logger
-        self._setup_webhook_logger(detailed_formatter)
-        
-        # Security alerts logger
-        self._setup_security_logger(detailed_formatter)
-        
-        # Database operations logger
-        self._setup_database_logger(detailed_formatter)
-        
-        # Errors logger
-        self._setup_error_logger(detailed_formatter)
-        
-        # Audit logger
-        self._setup_audit_logger(detailed_formatter)
-        
-        print("✅ Logging system started")
-    
-    def _setup_webhook_logger(self, formatter):
-        """Setup webhook events logger"""
-        webhook_logger = logging.getLogger('webhook_events')
-        webhook_logger.setLevel(logging.INFO)
-        
-        # Rotating file handler (50MB max, 10 backup)
-        webhook_handler = logging.handlers.RotatingFileHandler(
-            str(self.log_dir / 'webhook_events.log'),
-            maxBytes=50*1024*1024,  # 50MB
-            backupCount=10
+        # One console handler shared by the categories that echo to stderr
+        console_categories = {name for name, *_, console in LOG_CATEGORIES if console}
+        self._console = logging.StreamHandler()
+        self._console.setFormatter(detailed_formatter)
+        self._console.addFilter(lambda record: record.name in console_categories)
+        self._handlers.append(self._console)
+        
+        queue_handler = logging.handlers.QueueHandler(self._queue)
+        for name, level, filename, max_bytes, backup_count, console in LOG_CATEGORIES:
+            category_logger = logging.getLogger(name)
+            category_logger.setLevel(level)
+            category_logger.propagate = False
+            category_logger.addHandler(queue_handler)
+            
+            # Rotating file handler for this category's records only
+            file_handler = BatchRotatingFileHandler(
+                str(self.log_dir / filename),
+                maxBytes=max_bytes,
+                backupCount=backup_count
+            )
+            file_handler.setFormatter(detailed_formatter)
+            file_handler.addFilter(logging.Filter(name))
+            self._handlers.append(file_handler)
+        
+        # A single listener keeps records in order across all categories
+        self._listener = BatchQueueListener(
+            self._queue, *self._handlers, respect_handler_level=True
         )
-        webhook_handler.setFormatter(formatter)
-        webhook_logger.addHandler(webhook_handler)
-        
-        # Console handler
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(formatter)
-        webhook_logger.addHandler(console_handler)
-    
-    def _setup_security_logger(self, formatter):
-        """Setup security alerts logger"""
-        security_logger = logging.getLogger('security_alerts')
-        security_logger.setLevel(logging.WARNING)
-        
-        # Rotating file handler (20MB max, 5 backup)
-        security_handler = logging.handlers.RotatingFileHandler(
-            str(self.log_dir / 'security_alerts.log'),
-            maxBytes=20*1024*1024,  # 20MB
-            backupCount=5
-        )
-        security_handler.setFormatter(formatter)
-        security_logger.addHandler(security_handler)
-        
-        # Console handler
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(formatter)
-        security_logger.addHandler(console_handler)
-    
-    def _setup_database_logger(self, formatter):
-        """Setup database operations logger"""
-        db_logger = logging.getLogger('database_operations')
-        db_logger.setLevel(logging.INFO)
+        self._listener.start()
+        atexit.register(self._listener.stop)
         
-        # Rotating file handler (10MB max, 3 backup)
-        db_handler = logging.handlers.RotatingFileHandler(
-            str(self.log_dir / 'database_operations.log'),
-            maxBytes=10*1024*1024,  # 10MB
-            backupCount=3
-        )
-        db_handler.setFormatter(formatter)
-        db_logger.addHandler(db_handler)
-        
-        # Console handler
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(formatter)
-        db_logger.addHandler(console_handler)
-    
-    def _setup_error_logger(self, formatter):
-        """Setup errors logger"""
-        error_logger = logging.getLogger('errors')
-        error_logger.setLevel(logging.ERROR)
-        
-        # Rotating file handler (5MB max, 2 backup)
-        error_handler = logging.handlers.RotatingFileHandler(
-            str(self.log_dir / 'errors.log'),
-            maxBytes=5*1024*1024,  # 5MB
-            backupCount=2
-        )
-        error_handler.setFormatter(formatter)
-        error_logger.addHandler(error_handler)
-        
-        # Console handler
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(formatter)
-        error_logger.addHandler(console_handler)
-    
-    def _setup_audit_logger(self, formatter):
-        """Setup audit logger"""
-        audit_logger = logging.getLogger('audit')
-        audit_logger.setLevel(logging.INFO)
-        
-        # Rotating file handler (10MB max, 3 backup)
-        audit_handler = logging.handlers.RotatingFileHandler(
-            str(self.log_dir / 'audit.log'),
-            maxBytes=10*1024*1024,  # 10MB
-            backupCount=3
-        )
-        audit_handler.setFormatter(formatter)
-        audit_logger.addHandler(audit_handler)
+        print("✅ Logging system started")
     
     def log_webhook(self, level: str, message: str, **kwargs):
         """Log webhook events"""
-        logger = logging.getLogger('webhook_events')
-        full_message = f"{message} | {kwargs}"
-        getattr(logger, level.lower())(full_message)
+        # Arguments are only formatted if the level is enabled
+        self._webhook_logger.log(getattr(logging, level.upper()), '%s | %s', message, kwargs)
     
     def log_security(self, level: str, message: str, **kwargs):
         """Log security alerts"""
-        logger = logging.getLogger('security_alerts')
-        full_message = f"{message} | {kwargs}"
-        getattr(logger, level.lower())(full_message)
+        self._security_logger.log(getattr(logging, level.upper()), '%s | %s', message, kwargs)
     
     def log_database(self, level: str, message: str, **kwargs):
         """Log database operations"""
-        logger = logging.getLogger('database_operations')
-        full_message = f"{message} | {kwargs}"
-        getattr(logger, level.lower())(full_message)
+        self._db_logger.log(getattr(logging, level.upper()), '%s | %s', message, kwargs)
     
     def log_error(self, message: str, **kwargs):
         """Log errors"""
-        logger = logging.getLogger('errors')
-        full_message = f"{message} | {kwargs}"
-        logger.error(full_message)
+        self._error_logger.error('%s | %s', message, kwargs)
     
     def log_audit(self, message: str, **kwargs):
         """Log audit trail"""
-        logger = logging.getLogger('audit')
-        full_message = f"{message} | {kwargs}"
-        logger.info(full_message)
+        self._audit_logger.info('%s | %s', message, kwargs)
     
     def get_log_info(self) -> Dict[str, Any]:
         """Return information about log files"""
@@ -1,14 +1,363 @@
 import re
 import json
+import hashlib
 import logging
-from typing import List, Dict, Any, Tuple
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Iterator, NamedTuple, Optional, Tuple
 from pathlib import Path
 
+try:
+    import ahocorasick
+except ImportError:  # Optional: fall back to per-literal substring checks
+    ahocorasick = None
+
+from .helpers import orjson
+
 logger = logging.getLogger(__name__)
 
+# Pattern files (absolute path from project root)
+PATTERNS_DIR = Path(__file__).parent.parent.parent / "config" / "patterns"
+
+# Minimum seconds between checks of the pattern files for changes
+PATTERN_RELOAD_INTERVAL = 1.0
+
+# YAML documents whose findings are kept, keyed by content digest
+ANALYSIS_CACHE_SIZE = 128
+
+# Risk score per blacklist risk level (anything else scores 3.0)
+RISK_SCORES = {
+    'high': 8.0,
+    'medium': 5.0
+}
+
+# Script blocks in build logs: a command marker, a script keyword, then the next section end marker
+LOG_COMMAND_MARKER = re.compile(r'##\[command\]', re.IGNORECASE)
+LOG_SECTION_END_MARKER = re.compile(r'##\[section\]Finishing', re.IGNORECASE)
+LOG_SCRIPT_KEYWORDS = tuple(re.compile(keyword, re.IGNORECASE) for keyword in ('powershell', 'bash', 'python'))
+
+def _iter_script_blocks(log_content: str, keyword) -> Iterator[str]:
+    """Yield script blocks mentioning keyword, as a lazy DOTALL findall would, in linear time"""
+    # Each marker is searched once from where the previous one ended; a lazy
+    # DOTALL regex instead rescans the rest of the log from every failed start
+    pos = 0
+    while True:
+        start = LOG_COMMAND_MARKER.search(log_content, pos)
+        if start is None:
+            return
+        keyword_match = keyword.search(log_content, start.end())
+        if keyword_match is None:
+            return
+        end = LOG_SECTION_END_MARKER.search(log_content, keyword_match.end())
+        if end is None:
+            return
+        yield log_content[start.start():end.end()]
+        pos = end.end()
+
+# Control characters str patterns treat as whitespace (\s) but bytes patterns do not
+STR_ONLY_WHITESPACE = re.compile('[\x1c-\x1f]')
+
+def _compile_ascii(regex: str):
+    """Compile a case-insensitive bytes version of an ASCII regex, or return None"""
+    if not regex.isascii():
+        return None
+    try:
+        return re.compile(regex.encode('ascii'), re.IGNORECASE)
+    except re.error:
+        return None  # e.g. \u escapes, which only str patterns accept
+
+def _decode_match(match):
+    """Convert a bytes findall result (bytes or tuple of group bytes) to str"""
+    if isinstance(match, bytes):
+        return match.decode('ascii')
+    return tuple(group.decode('ascii') for group in match)
+
+REGEX_METACHARACTERS = set('.^$*+?{}[]()|')
+
+def _split_alternatives(regex: str) -> List[str]:
+    """Split a regex on its top-level '|' alternatives"""
+    alternatives = []
+    depth = 0
+    in_class = False
+    start = 0
+    i = 0
+    while i < len(regex):
+        char = regex[i]
+        if char == '\\':
+            i += 2
+            continue
+        if in_class:
+            if char == ']':
+                in_class = False
+        elif char == '[':
+            in_class = True
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            alternatives.append(regex[start:i])
+            start = i + 1
+        i += 1
+    alternatives.append(regex[start:])
+    return alternatives
+
+def _literal_prefix(regex: str) -> str:
+    """Return the literal text every match of a regex alternative starts with"""
+    literal = []
+    i = 0
+    while i < len(regex):
+        char = regex[i]
+        if char == '\\':
+            if i + 1 >= len(regex) or regex[i + 1].isalnum():
+                break  # Character class escape (\s, \d, ...) or backreference
+            literal.append(regex[i + 1])
+            i += 2
+        elif char in REGEX_METACHARACTERS:
+            break
+        else:
+            literal.append(char)
+            i += 1
+    
+    # A following ?, * or {m,n} quantifier makes the last literal optional
+    if literal and i < len(regex) and regex[i] in '?*{':
+        literal.pop()
+    return ''.join(literal)
+
+# Characters re.IGNORECASE matches to an ASCII letter, mapped before casefolding (İ and ı do not casefold to 'i')
+IGNORECASE_FOLDS = str.maketrans({
+    '\u0130': 'i',  # İ, LATIN CAPITAL LETTER I WITH DOT ABOVE (casefolds to 'i' + combining dot)
+    '\u0131': 'i',  # ı, LATIN SMALL LETTER DOTLESS I
+    '\u017f': 's',  # ſ, LATIN SMALL LETTER LONG S
+    '\u212a': 'k'   # K, KELVIN SIGN
+})
+
+def fold_case(text: str) -> str:
+    """Casefold text so that whatever re.IGNORECASE treats as equal compares equal"""
+    return text.translate(IGNORECASE_FOLDS).casefold()
+
+def literal_hints(regex: str) -> Optional[Tuple[str, ...]]:
+    """Return case-folded literals of which at least one occurs in any match, or None"""
+    hints = tuple(fold_case(_literal_prefix(alternative)) for alternative in _split_alternatives(regex))
+    if not all(hints):
+        return None
+    return hints
+
+def _load_json(path: Path) -> Any:
+    """Parse a JSON file, using orjson when available"""
+    if orjson is not None:
+        return orjson.loads(path.read_bytes())
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _compile_with_hints(patterns: Tuple[str, ...]) -> Tuple[Tuple[Any, Optional[Tuple[str, ...]]], ...]:
+    """Compile case-insensitive patterns together with their literal hints"""
+    return tuple((re.compile(pattern, re.IGNORECASE), literal_hints(pattern)) for pattern in patterns)
+
+# Additional language specific patterns: (regex, literal hints)
+POWERSHELL_PATTERNS = _compile_with_hints((
+    r'powershell\s+-Command\s+["\']',
+    r'powershell\s+-EncodedCommand\s+',
+    r'IEX\s+[`"\'][^`"\']*[`"\']',
+    r'Invoke-Expression\s+[`"\'][^`"\']*[`"\']'
+))
+
+BASH_PATTERNS = _compile_with_hints((
+    r'curl\s+.*\s*\|\s*bash',
+    r'wget\s+.*\s*\|\s*bash',
+    r'source\s+<\([^)]+\)',
+    r'eval\s+[`"\'][^`"\']*[`"\']'
+))
+
+PYTHON_PATTERNS = _compile_with_hints((
+    r'eval\s*\(',
+    r'exec\s*\(',
+    r'__import__\s*\(',
+    r'compile\s*\(',
+    r'os\.system\s*\(',
+    r'subprocess\.call\s*\('
+))
+
+class PatternSet(NamedTuple):
+    """Compiled patterns of one load of the pattern files, replaced as a whole on reload"""
+    blacklist: Tuple  # (name, regex, finding_fields, hints, ascii_regex)
+    whitelist: Tuple  # (name, regex)
+    automaton: Optional[Any]  # Literal hint -> blacklist indexes, when pyahocorasick is installed
+    hint_groups: Dict[str, Dict[str, set]]  # First character -> {hint: blacklist indexes}
+
 class SecurityAnalyzer:
     """Security analysis utilities for pipeline content"""
     
+    # Compiled pattern cache; scans read it once and use that snapshot throughout
+    _patterns = None
+    
+    # Pattern file modification times the cache was built from
+    _pattern_mtimes = None
+    _next_reload_check = 0.0
+    _reload_lock = threading.Lock()
+    
+    # Findings of recently analyzed YAML: content digest -> findings (cleared when patterns reload)
+    _findings_cache = OrderedDict()
+    _findings_cache_lock = threading.Lock()
+    
+    @staticmethod
+    def _pattern_file_mtimes() -> Tuple[Optional[int], ...]:
+        """Return blacklist/whitelist modification times (None for a missing file)"""
+        mtimes = []
+        for filename in ("blacklist.json", "whitelist.json"):
+            try:
+                mtimes.append((PATTERNS_DIR / filename).stat().st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return tuple(mtimes)
+    
+    @classmethod
+    def compile_patterns(cls) -> bool:
+        """Load blacklist/whitelist files and compile their patterns, again only when they change"""
+        # Stat the files at most once per interval
+        if cls._patterns is not None and time.monotonic() < cls._next_reload_check:
+            return True
+        
+        # One thread checks and reloads; the others wait for it
+        with cls._reload_lock:
+            return cls._reload_patterns()
+    
+    @classmethod
+    def _reload_patterns(cls) -> bool:
+        """Compile the pattern files if they changed; call with _reload_lock held"""
+        if cls._patterns is not None:
+            now = time.monotonic()
+            if now < cls._next_reload_check:
+                return True
+            cls._next_reload_check = now + PATTERN_RELOAD_INTERVAL
+            
+            if cls._pattern_file_mtimes() == cls._pattern_mtimes:
+                return True
+            logger.info("Pattern files changed, reloading")
+        
+        # Recorded before reading, so a change made meanwhile triggers another reload
+        cls._pattern_mtimes = cls._pattern_file_mtimes()
+        cls._next_reload_check = time.monotonic() + PATTERN_RELOAD_INTERVAL
+        
+        # A failed reload keeps the previously compiled patterns
+        blacklist_path = PATTERNS_DIR / "blacklist.json"
+        if not blacklist_path.exists():
+            logger.error(f"Blacklist file not found: {blacklist_path}")
+            return cls._patterns is not None
+        
+        try:
+            blacklist = _load_json(blacklist_path)
+            
+            # Read whitelist patterns
+            whitelist_path = PATTERNS_DIR / "whitelist.json"
+            if whitelist_path.exists():
+                whitelist = _load_json(whitelist_path)
+            else:
+                logger.warning(f"Whitelist file not found: {whitelist_path}")
+                whitelist = {"patterns": {}}
+        except (OSError, ValueError) as e:
+            logger.error(f"Pattern file read error: {e}")
+            return cls._patterns is not None
+        
+        compiled_blacklist = []
+        for pattern_name, pattern_data in blacklist['patterns'].items():
+            try:
+                compiled_blacklist.append((
+                    pattern_name,
+                    re.compile(pattern_data['regex'], re.IGNORECASE),
+                    {
+                        'risk_score': RISK_SCORES.get(pattern_data.get('risk_level', 'medium'), 3.0),
+                        'description': pattern_data.get('description', 'Security pattern')
+                    },
+                    literal_hints(pattern_data['regex']),
+                    _compile_ascii(pattern_data['regex'])
+                ))
+            except re.error as e:
+                logger.warning(f"Regex error - {pattern_name}: {e}")
+        
+        compiled_whitelist = []
+        for whitelist_name, whitelist_data in whitelist['patterns'].items():
+            try:
+                compiled_whitelist.append(
+                    (whitelist_name, re.compile(whitelist_data['regex'], re.IGNORECASE))
+                )
+            except re.error as e:
+                logger.warning(f"Regex error - {whitelist_name}: {e}")
+        
+        patterns = PatternSet(
+            blacklist=tuple(compiled_blacklist),
+            whitelist=tuple(compiled_whitelist),
+            automaton=cls._build_automaton(compiled_blacklist),
+            hint_groups=cls._group_hints(compiled_blacklist)
+        )
+        
+        # Swapped together with the cache clear, so no findings of the old patterns survive
+        with cls._findings_cache_lock:
+            cls._patterns = patterns
+            cls._findings_cache.clear()
+        return True
+    
+    @staticmethod
+    def _build_automaton(blacklist: List[Tuple]) -> Optional[Any]:
+        """Build an Aho-Corasick automaton mapping literal hints to blacklist indexes"""
+        if ahocorasick is None:
+            return None
+        
+        automaton = ahocorasick.Automaton()
+        for index, (_, _, _, hints, _) in enumerate(blacklist):
+            for hint in hints or ():
+                if hint in automaton:
+                    automaton.get(hint).add(index)
+                else:
+                    automaton.add_word(hint, {index})
+        
+        if len(automaton) == 0:
+            return None
+        automaton.make_automaton()
+        return automaton
+    
+    @staticmethod
+    def _group_hints(blacklist: List[Tuple]) -> Dict[str, Dict[str, set]]:
+        """Group literal hints by first character: {char: {hint: blacklist indexes}}"""
+        groups = {}
+        for index, (_, _, _, hints, _) in enumerate(blacklist):
+            for hint in hints or ():
+                groups.setdefault(hint[0], {}).setdefault(hint, set()).add(index)
+        return groups
+    
+    @staticmethod
+    def _candidate_patterns(patterns: PatternSet, content: str) -> List[Tuple]:
+        """Return blacklist entries whose literal hints occur in the content"""
+        # Hints were folded the same way when the automaton and groups were built
+        folded_content = fold_case(content)
+        hit_indexes = set()
+        if patterns.automaton is not None:
+            # Single pass over the content for all literals at once
+            for _, indexes in patterns.automaton.iter(folded_content):
+                hit_indexes.update(indexes)
+        else:
+            # One character scan rules out every hint sharing that first character
+            for first_char, hints in patterns.hint_groups.items():
+                if first_char not in folded_content:
+                    continue
+                for hint, indexes in hints.items():
+                    if hint in folded_content:
+                        hit_indexes.update(indexes)
+        
+        return [
+            entry for index, entry in enumerate(patterns.blacklist)
+            if not entry[3] or index in hit_indexes
+        ]
+    
+    @staticmethod
+    def _match_whitelist(patterns: PatternSet, content: str) -> Optional[str]:
+        """Return the name of the first whitelist pattern found in the content, or None"""
+        for whitelist_name, whitelist_regex in patterns.whitelist:
+            if whitelist_regex.search(content):
+                return whitelist_name
+        return None
+    
     @staticmethod
     def analyze_script_content(content: str, script_type: str = None) -> Dict[str, Any]:
         """Analyze script content for security risks"""
@@ -44,23 +393,24 @@ class SecurityAnalyzer:
         
         return results
     
+    @staticmethod
+    def _check_dynamic_execution(results: Dict[str, Any], content: str, patterns: Tuple) -> None:
+        """Add language specific findings, skipping patterns whose literal text is absent"""
+        folded_content = fold_case(content) if content else ''
+        for pattern, hints in patterns:
+            if hints and not any(hint in folded_content for hint in hints):
+                continue
+            if pattern.search(content):
+                results['has_dangerous_patterns'] = True
+                results['dangerous_patterns_found'].append(f"Dynamic execution: {pattern.pattern}")
+    
     @staticmethod
     def analyze_powershell_script(content: str) -> Dict[str, Any]:
         """Analyze PowerShell script specifically"""
         results = SecurityAnalyzer.analyze_script_content(content, 'powershell')
         
         # Additional PowerShell specific checks
-        additional_patterns = [
-            r'powershell\s+-Command\s+["\']',
-            r'powershell\s+-EncodedCommand\s+',
-            r'IEX\s+[`"\'][^`"\']*[`"\']',
-            r'Invoke-Expression\s+[`"\'][^`"\']*[`"\']'
-        ]
-        
-        for pattern in additional_patterns:
-            if re.search(pattern, content, re.IGNORECASE):
-                results['has_dangerous_patterns'] = True
-                results['dangerous_patterns_found'].append(f"Dynamic execution: {pattern}")
+        SecurityAnalyzer._check_dynamic_execution(results, content, POWERSHELL_PATTERNS)
         
         return results
     
@@ -70,17 +420,7 @@ class SecurityAnalyzer:
         results = SecurityAnalyzer.analyze_script_content(content, 'bash')
         
         # Additional Bash specific checks
-        additional_patterns = [
-            r'curl\s+.*\s*\|\s*bash',
-            r'wget\s+.*\s*\|\s*bash',
-            r'source\s+<\([^)]+\)',
-            r'eval\s+[`"\'][^`"\']*[`"\']'
-        ]
-        
-        for pattern in additional_patterns:
-            if re.search(pattern, content, re.IGNORECASE):
-                results['has_dangerous_patterns'] = True
-                results['dangerous_patterns_found'].append(f"Dynamic execution: {pattern}")
+        SecurityAnalyzer._check_dynamic_execution(results, content, BASH_PATTERNS)
         
         return results
     
@@ -90,19 +430,7 @@ class SecurityAnalyzer:
         results = SecurityAnalyzer.analyze_script_content(content, 'python')
         
         # Additional Python specific checks
-        additional_patterns = [
-            r'eval\s*\(',
-            r'exec\s*\(',
-            r'__import__\s*\(',
-            r'compile\s*\(',
-            r'os\.system\s*\(',
-            r'subprocess\.call\s*\('
-        ]
-        
-        for pattern in additional_patterns:
-            if re.search(pattern, content, re.IGNORECASE):
-                results['has_dangerous_patterns'] = True
-                results['dangerous_patterns_found'].append(f"Dynamic execution: {pattern}")
+        SecurityAnalyzer._check_dynamic_execution(results, content, PYTHON_PATTERNS)
         
         return results
     
@@ -129,68 +457,27 @@ class SecurityAnalyzer:
             return findings
         
         try:
-            # Absolute path kullan - proje root'unu bul
-            project_root = Path(__file__).parent.parent.parent
-            blacklist_path = project_root / "config" / "patterns" / "blacklist.json"
-            
-            if blacklist_path.exists():
-                with open(blacklist_path, 'r', encoding='utf-8') as f:
-                    blacklist = json.load(f)
-            else:
-                logger.error(f"Blacklist file not found: {blacklist_path}")
+            if not SecurityAnalyzer.compile_patterns():
                 return findings
+            patterns = SecurityAnalyzer._patterns
             
-            # Read whitelist patterns
-            whitelist_path = project_root / "config" / "patterns" / "whitelist.json"
-            if whitelist_path.exists():
-                with open(whitelist_path, 'r', encoding='utf-8') as f:
-                    whitelist = json.load(f)
-            else:
-                logger.warning(f"Whitelist file not found: {whitelist_path}")
-                whitelist = {"patterns": {}}
+            # Builds of an unchanged pipeline send the same YAML; reuse its findings
+            digest = hashlib.blake2b(yaml_content.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+            with SecurityAnalyzer._findings_cache_lock:
+                cached = SecurityAnalyzer._findings_cache.get(digest)
+                if cached is not None:
+                    SecurityAnalyzer._findings_cache.move_to_end(digest)
+            if cached is not None:
+                return [dict(finding, matches=list(finding['matches'])) for finding in cached]
             
-            # Check each blacklist pattern
-            for pattern_name, pattern_data in blacklist['patterns'].items():
-                try:
-                    regex = pattern_data['regex']
-                    matches = re.findall(regex, yaml_content, re.IGNORECASE)
-                    
-                    if matches:
-                        # Whitelist check
-                        is_whitelisted = False
-                        for whitelist_name, whitelist_data in whitelist['patterns'].items():
-                            whitelist_regex = whitelist_data['regex']
-                            whitelist_matches = re.findall(whitelist_regex, yaml_content, re.IGNORECASE)
-                            if whitelist_matches:
-                                # If whitelist pattern matches, skip this pattern
-                                is_whitelisted = True
-                                logger.info(f"Pattern '{pattern_name}' blocked by whitelist '{whitelist_name}'")
-                                break
-                        
-                        if not is_whitelisted:
-                            # Determine risk score
-                            risk_level = pattern_data.get('risk_level', 'medium')
-                            if risk_level == 'high':
-                                risk_score = 8.0
-                            elif risk_level == 'medium':
-                                risk_score = 5.0
-                            else:
-                                risk_score = 3.0
-                            
-                            findings.append({
-                                'pattern': pattern_name,
-                                'count': len(matches),
-                                'matches': matches[:3],  # First 3 matches
-                                'risk_score': risk_score,
-                                'description': pattern_data.get('description', 'Security pattern')
-                            })
-                    
-                except re.error as e:
-                    logger.warning(f"Regex error - {pattern_name}: {e}")
-                    continue
+            SecurityAnalyzer._scan_yaml_content(patterns, yaml_content, findings)
             
-            # Sort by risk score
-            findings.sort(key=lambda x: x['risk_score'], reverse=True)
+            with SecurityAnalyzer._findings_cache_lock:
+                # Patterns reloaded during the scan: these findings are not cached
+                if SecurityAnalyzer._patterns is patterns:
+                    SecurityAnalyzer._findings_cache[digest] = [dict(finding, matches=list(finding['matches'])) for finding in findings]
+                    if len(SecurityAnalyzer._findings_cache) > ANALYSIS_CACHE_SIZE:
+                        SecurityAnalyzer._findings_cache.popitem(last=False)
             
             return findings
             
@@ -198,6 +485,51 @@ class SecurityAnalyzer:
             logger.error(f"Pattern analysis error: {e}")
             return findings
     
+    @staticmethod
+    def _scan_yaml_content(patterns: PatternSet, yaml_content: str, findings: List[Dict[str, Any]]) -> None:
+        """Run the blacklist and whitelist patterns over the content, appending findings"""
+        # Only run regexes whose literal text occurs in the content
+        candidates = SecurityAnalyzer._candidate_patterns(patterns, yaml_content)
+        
+        # Whitelist only depends on the content; scan for it once, on the first hit
+        whitelist_checked = False
+        
+        # Check each candidate blacklist pattern
+        # ASCII content gives the same matches with bytes patterns, which run faster
+        ascii_content = None
+        if yaml_content.isascii() and not STR_ONLY_WHITESPACE.search(yaml_content):
+            ascii_content = yaml_content.encode('ascii')
+        
+        for pattern_name, regex, finding_fields, hints, ascii_regex in candidates:
+            if ascii_content is not None and ascii_regex is not None:
+                matches = ascii_regex.findall(ascii_content)
+                examples = [_decode_match(match) for match in matches[:3]]
+            else:
+                matches = regex.findall(yaml_content)
+                examples = matches[:3]
+            
+            if matches:
+                # Whitelist check
+                if not whitelist_checked:
+                    whitelist_name = SecurityAnalyzer._match_whitelist(patterns, yaml_content)
+                    if whitelist_name is not None:
+                        # A whitelisted document blocks every pattern; skip the remaining scans
+                        logger.info(f"Pattern '{pattern_name}' and any further patterns blocked by whitelist '{whitelist_name}'")
+                        findings.clear()
+                        return
+                    whitelist_checked = True
+                
+                # Risk score and description are resolved when patterns are compiled
+                findings.append({
+                    'pattern': pattern_name,
+                    'count': len(matches),
+                    'matches': examples,  # First 3 matches
+                    **finding_fields
+                })
+        
+        # Sort by risk score
+        findings.sort(key=lambda x: x['risk_score'], reverse=True)
+    
     @staticmethod
     def analyze_log_content(log_content: str) -> Dict[str, Any]:
         """Analyze log content for security issues"""
@@ -210,18 +542,16 @@ class SecurityAnalyzer:
         if not log_content:
             return results
         
-        # Find script blocks in logs
-        script_patterns = [
-            r'##\[command\].*?powershell.*?##\[section\]Finishing',
-            r'##\[command\].*?bash.*?##\[section\]Finishing',
-            r'##\[command\].*?python.*?##\[section\]Finishing'
-        ]
+        # A block can match several patterns; analyze each distinct block once
+        analyzed = {}
         
-        for pattern in script_patterns:
-            matches = re.findall(pattern, log_content, re.DOTALL | re.IGNORECASE)
-            for match in matches:
-                script_type = SecurityAnalyzer.get_script_type(match)
-                analysis = SecurityAnalyzer.analyze_script_content(match, script_type)
+        # Find script blocks in logs
+        for keyword in LOG_SCRIPT_KEYWORDS:
+            for match in _iter_script_blocks(log_content, keyword):
+                if match not in analyzed:
+                    script_type = SecurityAnalyzer.get_script_type(match)
+                    analyzed[match] = (script_type, SecurityAnalyzer.analyze_script_content(match, script_type))
+                script_type, analysis = analyzed[match]
                 
                 if analysis['has_dangerous_patterns']:
                     results['script_blocks'].append({
@@ -4,16 +4,18 @@ Webhook Build YAML Analyzer
 Performs YAML analysis using build information from webhook
 """
 
-import requests
 from requests.auth import HTTPBasicAuth
 import json
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Add src to path for imports
 sys.path.append(str(Path(__file__).parent.parent))
 
+from src.utils.helpers import REQUEST_TIMEOUT, create_session, orjson, run_report
+
 # Load .env file with explicit path and override
 from dotenv import load_dotenv
 env_path = Path(__file__).parent.parent / '.env'
@@ -27,10 +29,22 @@ build_id = int(os.getenv('AZURE_BUILD_ID', '132'))
 pat = os.getenv('AZURE_PAT', '')
 devops_server_url = os.getenv('AZURE_DEVOPS_SERVER_URL', 'https://dev.azure.com')
 
+# Shared session keeps connections (and TLS handshakes) alive between calls
+session = create_session(HTTPBasicAuth('', pat), pool_connections=8, pool_maxsize=8, backoff_factor=0.2)
+session.headers.update({'Accept': 'application/json'})
+
+def write_json(filename, data):
+    """Write data to an indented UTF-8 JSON file, using orjson when available"""
+    if orjson is not None:
+        Path(filename).write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+        return
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
 def get_pipeline_yaml(definition_id):
     """Gets pipeline YAML definition"""
     url = f'{devops_server_url}/{organization}/{project}/_apis/build/definitions/{definition_id}?api-version=6.0'
-    response = requests.get(url, auth=HTTPBasicAuth('', pat))
+    response = session.get(url, timeout=REQUEST_TIMEOUT)
     
     if response.status_code == 200:
         return response.json()
@@ -40,15 +54,14 @@ def get_pipeline_yaml(definition_id):
         return None
 
 def get_build_timeline(build_id):
-    """Gets build timeline"""
+    """Gets build timeline: (timeline, error message), leaving the printing to the caller"""
     url = f'{devops_server_url}/{organization}/{project}/_apis/build/builds/{build_id}/timeline?api-version=6.0'
-    response = requests.get(url, auth=HTTPBasicAuth('', pat))
+    response = session.get(url, timeout=REQUEST_TIMEOUT)
     
     if response.status_code == 200:
-        return response.json()
+        return response.json(), None
     else:
-        print(f"Failed to get build timeline: {response.status_code}")
-        return None
+        return None, f"Failed to get build timeline: {response.status_code}"
 
 def analyze_webhook_build():
     """Analyzes build from webhook"""
@@ -66,6 +79,11 @@ def analyze_webhook_build():
         print("Please add your Personal Access Token to .env file")
         return
     
+    # Definition and timeline are independent; the timeline request overlaps the definition's
+    executor = ThreadPoolExecutor(max_workers=1)
+    timeline_future = executor.submit(get_build_timeline, build_id)
+    executor.shutdown(wait=False)
+    
     # Get pipeline definition
     print(f"\n📋 Getting Pipeline YAML Definition...")
     pipeline_def = get_pipeline_yaml(definition_id)
@@ -111,8 +129,7 @@ def analyze_webhook_build():
         
         # Save to JSON file
         filename = f'webhook_pipeline_{definition_id}_definition.json'
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(pipeline_def, f, indent=2, ensure_ascii=False)
+        write_json(filename, pipeline_def)
         
         print(f"\n✅ Pipeline definition saved to {filename}")
         
@@ -121,7 +138,9 @@ def analyze_webhook_build():
     
     # Get build timeline
     print(f"\n📋 Getting Build Timeline...")
-    timeline = get_build_timeline(build_id)
+    timeline, timeline_error = timeline_future.result()
+    if timeline_error:
+        print(timeline_error)  # Printed here, where the synchronous fetch printed it
     
     if timeline:
         print(f"✅ Build timeline received")
@@ -139,8 +158,7 @@ def analyze_webhook_build():
         
         # Save to JSON file
         filename = f'webhook_build_{build_id}_timeline.json'
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(timeline, f, indent=2, ensure_ascii=False)
+        write_json(filename, timeline)
         
         print(f"\n✅ Build timeline saved to {filename}")
         
@@ -148,4 +166,4 @@ def analyze_webhook_build():
         print("❌ Failed to get build timeline")
 
 if __name__ == "__main__":
-    analyze_webhook_build() 
\ No newline at end of file
+    run_report(analyze_webhook_build) 
\ No newline at end of file
@@ -4,13 +4,17 @@ Debug Slack Notifications
 Test Slack webhook functionality
 """
 
-import requests
-import json
 import logging
 import os
+import sys
 from pathlib import Path
 from dotenv import load_dotenv
 
+# Add src to path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.utils.helpers import create_session
+
 # Load .env file
 env_path = Path(__file__).parent.parent / '.env'
 load_dotenv(env_path, override=True)
@@ -22,6 +26,12 @@ logger = logging.getLogger(__name__)
 # Get Slack webhook URL from environment
 SLACK_WEBHOOK_URL = os.getenv('SLACK_WEBHOOK_URL')
 
+# (connect, read) timeouts in seconds; a hung endpoint must not block the process
+REQUEST_TIMEOUT = (3.05, 5)
+
+# Shared session keeps the connection to Slack alive between notifications
+session = create_session(pool_connections=1, pool_maxsize=2, retries=0)
+
 def test_slack_notification():
     """Test Slack notification"""
     if not SLACK_WEBHOOK_URL:
@@ -37,16 +47,16 @@ def test_slack_notification():
             "text": "🧪 Test notification from Pipeline Security Scanner"
         }
         
-        response = requests.post(SLACK_WEBHOOK_URL, json=message)
-    
-    if response.status_code == 200:
+        response = session.post(SLACK_WEBHOOK_URL, json=message, timeout=REQUEST_TIMEOUT)
+        
+        if response.status_code == 200:
             logger.info("✅ Slack test notification sent successfully")
             return True
-    else:
+        else:
             logger.error(f"❌ Slack notification failed: {response.status_code}")
             return False
         
-except Exception as e:
+    except Exception as e:
         logger.error(f"❌ Slack notification error: {e}")
         return False
 
@@ -4,20 +4,55 @@ Azure DevOps WebSocket Webhook Server
 WebSocket-based webhook server to eliminate connection timeout issues
 """
 
+import os
+
+# Socket.IO concurrency model: 'threading' (default), or 'gevent' / 'eventlet' when installed
+ASYNC_MODE = os.getenv('SOCKETIO_ASYNC_MODE', 'threading')
+
+# Cooperative modes must patch the standard library before anything else imports it
+if ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+elif ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+
 from flask import Flask, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_socketio import SocketIO, emit, join_room, leave_room
 import json
 import logging
-from datetime import datetime
-import os
+import sqlite3
+from collections import deque
+from datetime import datetime, timedelta
+from pathlib import Path
+import sys
 import time
 import threading
 
+# Add src to path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.utils.helpers import SocketIOJson, orjson
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, for request bodies and jsonify responses"""
+    
+    def dumps(self, obj, **kwargs):
+        # Always compact; types orjson does not know go through Flask's default handling
+        return orjson.dumps(obj, default=self.default).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+if orjson is not None:
+    # Stored webhook payloads are large nested dicts; encode them with orjson
+    app.json = OrjsonProvider(app)
 
 # Load secret key from environment variable
 import os
@@ -29,16 +64,30 @@ if not secret_key:
     logger.warning("⚠️ FLASK_SECRET_KEY not set, using generated key")
 
 app.config['SECRET_KEY'] = secret_key
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=ASYNC_MODE,
+                    json=SocketIOJson if orjson is not None else None)
 
 # Global variables
-webhook_events = []
 MAX_EVENTS = 50
 MAX_EVENT_AGE = 3600  # 1 saat
 
-# Connection tracking
+# Minimum seconds between expired-event sweeps on the webhook path
+CLEANUP_INTERVAL = 30
+
+# Seconds a /ping or /status body is reused for repeated health checks
+STATUS_CACHE_TTL = 1.0
+
+# Keep request headers with stored events (they may carry the service hook's credentials)
+STORE_WEBHOOK_HEADERS = os.getenv('STORE_WEBHOOK_HEADERS', 'false').lower() == 'true'
+webhook_events = deque(maxlen=MAX_EVENTS)  # Oldest events drop off the left as new ones arrive
+events_lock = threading.Lock()
+
+# SQLite file keeping the stored events (and the request_id counter) across server restarts
+WEBHOOK_INBOX_PATH = Path(os.getenv('WEBHOOK_INBOX_PATH', Path(__file__).parent.parent / 'data' / 'webhook_inbox.db'))
+
+# Connection tracking; Engine.IO ping/pong disconnects dead clients
 connected_clients = set()
-client_heartbeats = {}
+clients_lock = threading.Lock()  # Held to change the set or copy it; len() needs no lock
 last_webhook_time = None
 
 # Detailed logging
@@ -46,22 +95,123 @@ request_count = 0
 last_request_time = time.time()
 error_count = 0
 last_error_time = None
+last_cleanup_time = 0.0
+status_cache = {}  # endpoint -> (monotonic time, payload)
+
+def open_inbox():
+    """Open the inbox database, creating it if needed"""
+    WEBHOOK_INBOX_PATH.parent.mkdir(parents=True, exist_ok=True)
+    # Shared by request threads; every use holds events_lock
+    connection = sqlite3.connect(WEBHOOK_INBOX_PATH, check_same_thread=False)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute(
+        'CREATE TABLE IF NOT EXISTS inbox ('
+        'request_id INTEGER PRIMARY KEY, timestamp TEXT NOT NULL, record TEXT NOT NULL)'
+    )
+    connection.commit()
+    return connection
+
+def load_inbox():
+    """Restore the recent events and the request counter saved by a previous run"""
+    global request_count
+    cutoff = (datetime.now() - timedelta(seconds=MAX_EVENT_AGE)).isoformat()
+    with events_lock:
+        rows = inbox.execute(
+            'SELECT record FROM inbox WHERE timestamp >= ? ORDER BY request_id DESC LIMIT ?',
+            (cutoff, MAX_EVENTS)
+        ).fetchall()
+        for record, in reversed(rows):
+            event = app.json.loads(record)
+            # Records saved before epoch timestamps were stored
+            event.setdefault('ts_epoch', datetime.fromisoformat(event['timestamp']).timestamp())
+            webhook_events.append(event)
+        request_count = inbox.execute('SELECT COALESCE(MAX(request_id), 0) FROM inbox').fetchone()[0]
+    
+    if rows:
+        logger.info(f"📂 {len(rows)} stored events restored (last request ID: {request_count})")
+
+def prune_inbox():
+    """Delete inbox rows that left the in-memory window; call with events_lock held"""
+    # The newest row is always kept so the request counter survives a restart
+    oldest = webhook_events[0]['request_id'] if webhook_events else request_count
+    inbox.execute('DELETE FROM inbox WHERE request_id < ?', (oldest,))
 
 def cleanup_old_events():
     """Clean up old events to prevent memory leak"""
-    global webhook_events
-    current_time = datetime.now()
+    cutoff = time.time() - MAX_EVENT_AGE
     
-    webhook_events = [
-        event for event in webhook_events 
-        if (current_time - datetime.fromisoformat(event['timestamp'])).total_seconds() < MAX_EVENT_AGE
-    ]
-    
-    if len(webhook_events) > MAX_EVENTS:
-        webhook_events = webhook_events[-MAX_EVENTS:]
+    # Events are stored oldest first, so expired ones are always at the left
+    with events_lock:
+        expired = 0
+        while webhook_events and webhook_events[0]['ts_epoch'] <= cutoff:
+            webhook_events.popleft()
+            expired += 1
+        if expired:
+            prune_inbox()
+            inbox.commit()
     
     logger.info(f"🧹 Memory cleanup: {len(webhook_events)} events remaining")
 
+def compact_event_data(data):
+    """Keep the parts of an Azure DevOps payload listeners use: event type and resource"""
+    # The resource is kept whole; listeners store it as the event's raw data.
+    # Messages, resource containers and notification metadata are dropped.
+    return {
+        'eventType': data.get('eventType'),
+        'resource': data.get('resource', {})
+    }
+
+def record_request(event_record=None):
+    """Assign the next request_id and store the event under it; ids and appends share one events_lock hold"""
+    global request_count
+    with events_lock:
+        request_count += 1
+        if event_record is not None:
+            event_record['request_id'] = request_count
+            # Saved before it is announced, so a restart cannot lose an acknowledged event
+            inbox.execute(
+                'INSERT INTO inbox (request_id, timestamp, record) VALUES (?, ?, ?)',
+                (request_count, event_record['timestamp'], app.json.dumps(event_record))
+            )
+            webhook_events.append(event_record)  # maxlen drops the oldest beyond MAX_EVENTS
+            prune_inbox()
+            inbox.commit()
+        return request_count
+
+def events_since(since):
+    """Return stored events with a request_id above since (all events if the id was never issued)"""
+    with events_lock:
+        # A cursor beyond the counter comes from a discarded inbox; send everything
+        if not since or since > request_count:
+            return list(webhook_events)
+        
+        # load_inbox and record_request append in request_id order, so the newer ones are at the right
+        newer = []
+        for event in reversed(webhook_events):
+            if event['request_id'] <= since:
+                break
+            newer.append(event)
+    
+    newer.reverse()
+    return newer
+
+# Events received before a restart are served again
+inbox = open_inbox()
+load_inbox()
+
+def cached_json_response(name, build):
+    """JSON response for the payload build() made less than STATUS_CACHE_TTL ago, or a new one"""
+    now = time.monotonic()
+    cached = status_cache.get(name)
+    if cached and now - cached[0] < STATUS_CACHE_TTL:
+        body = cached[1]
+    else:
+        # Kept encoded, so repeated polls skip serialization as well
+        body = app.json.dumps(build()) + '\n'
+        status_cache[name] = (now, body)
+    
+    return app.response_class(body, mimetype='application/json')
+
 def broadcast_event(event_data):
     """Broadcast event to all connected WebSocket clients"""
     try:
@@ -70,40 +220,13 @@ def broadcast_event(event_data):
     except Exception as e:
         logger.error(f"❌ Failed to broadcast event: {e}")
 
-def start_heartbeat_monitor():
-    """Monitor client heartbeats and clean up inactive connections"""
-    def monitor():
-        while True:
-            try:
-                current_time = time.time()
-                inactive_clients = []
-                
-                for client_id, last_heartbeat in client_heartbeats.items():
-                    if current_time - last_heartbeat > 30:  # 30 saniye timeout
-                        inactive_clients.append(client_id)
-                
-                for client_id in inactive_clients:
-                    del client_heartbeats[client_id]
-                    connected_clients.discard(client_id)
-                    logger.info(f"🔌 Inactive client removed: {client_id}")
-                
-                time.sleep(10)  # Check every 10 seconds
-                
-            except Exception as e:
-                logger.error(f"❌ Heartbeat monitor error: {e}")
-                time.sleep(10)
-    
-    thread = threading.Thread(target=monitor, daemon=True)
-    thread.start()
-    logger.info("💓 Heartbeat monitor started")
-
 # WebSocket Events
 @socketio.on('connect')
 def handle_connect():
     """Handle WebSocket client connection"""
     client_id = request.sid
-    connected_clients.add(client_id)
-    client_heartbeats[client_id] = time.time()
+    with clients_lock:
+        connected_clients.add(client_id)
     
     logger.info(f"🔌 Client connected: {client_id} (Total: {len(connected_clients)})")
     
@@ -120,17 +243,15 @@ def handle_connect():
 def handle_disconnect():
     """Handle WebSocket client disconnection"""
     client_id = request.sid
-    connected_clients.discard(client_id)
-    if client_id in client_heartbeats:
-        del client_heartbeats[client_id]
+    with clients_lock:
+        connected_clients.discard(client_id)
     
     logger.info(f"🔌 Client disconnected: {client_id} (Total: {len(connected_clients)})")
 
 @socketio.on('heartbeat')
 def handle_heartbeat():
-    """Handle client heartbeat"""
+    """Handle client heartbeat (older listeners; liveness is tracked by Engine.IO ping/pong)"""
     client_id = request.sid
-    client_heartbeats[client_id] = time.time()
     
     # Send heartbeat response
     emit('heartbeat_response', {
@@ -139,14 +260,16 @@ def handle_heartbeat():
     })
 
 @socketio.on('request_events')
-def handle_request_events():
+def handle_request_events(data=None):
     """Handle client request for events"""
     client_id = request.sid
+    since = (data or {}).get('since', 0)
     
-    # Send all events to client
+    # Send the events the client has not seen yet
     emit('events_data', {
-        'events': webhook_events,
+        'events': events_since(since),
         'total_events': len(webhook_events),
+        'last_request_id': request_count,
         'timestamp': datetime.now().isoformat()
     })
     
@@ -164,80 +287,83 @@ def handle_join_room(data):
 def webhook_handler():
     """Handles Azure DevOps webhooks"""
     
-    global request_count, last_request_time, error_count, last_error_time, last_webhook_time
+    global last_request_time, error_count, last_error_time, last_webhook_time, last_cleanup_time
     
+    request_id = None
     try:
-        request_count += 1
         last_request_time = time.time()
-        last_webhook_time = datetime.now().isoformat()
+        last_webhook_time = datetime.fromtimestamp(last_request_time).isoformat()
+        
+        # Parsed before an id is assigned; record_request stores events in request_id order
+        data = request.get_json()
+        event_record = None
+        if data:
+            event_type = data.get('eventType', 'unknown')
+            event_data = compact_event_data(data)
+            event_record = {
+                'timestamp': last_webhook_time,
+                'ts_epoch': last_request_time,  # Compared directly by cleanup_old_events
+                'event_type': event_type,
+                'data': event_data,
+                'headers': dict(request.headers) if STORE_WEBHOOK_HEADERS else None,
+                'request_id': None  # Assigned by record_request
+            }
+        request_id = record_request(event_record)
         
         # Log request
-        logger.info(f"📥 Webhook #{request_count} received: {request.method} {request.url}")
-        logger.info(f"📋 Headers: {dict(request.headers)}")
-        logger.info(f"🕐 Request time: {last_webhook_time}")
+        logger.info("📥 Webhook #%s received: %s %s", request_id, request.method, request.url)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("📋 Headers: %s", dict(request.headers))
+        logger.info("🕐 Request time: %s", last_webhook_time)
         
-        # Get JSON body
-        data = request.get_json()
-        if not data:
+        if event_record is None:
             logger.warning("❌ JSON body not found")
             error_count += 1
             last_error_time = time.time()
             return jsonify({"error": "No JSON data"}), 400
         
-        # Get event type
-        event_type = data.get('eventType', 'unknown')
-        logger.info(f"📋 Event Type: {event_type}")
-        
-        # Store event
-        global webhook_events
-        event_record = {
-            'timestamp': datetime.now().isoformat(),
-            'event_type': event_type,
-            'data': data,
-            'headers': dict(request.headers),
-            'request_id': request_count
-        }
-        webhook_events.append(event_record)
-        
-        # Clean old events
-        if len(webhook_events) > MAX_EVENTS:
-            webhook_events = webhook_events[-MAX_EVENTS:]
-            logger.info(f"🔄 Old events cleaned. Remaining events: {len(webhook_events)}")
+        logger.info("📋 Event Type: %s", event_type)
         
         # Cleanup old events periodically
-        cleanup_old_events()
+        if last_request_time - last_cleanup_time >= CLEANUP_INTERVAL:
+            last_cleanup_time = last_request_time
+            cleanup_old_events()
         
         # Analyze Azure DevOps events
         analyze_azure_devops_event(data)
         
-        # Broadcast to WebSocket clients
+        # Broadcast to WebSocket clients, payload included so they need not re-request all events
         broadcast_event({
             'event_type': event_type,
             'timestamp': event_record['timestamp'],
-            'request_id': request_count,
+            'request_id': request_id,
+            'data': event_data,
             'connected_clients': len(connected_clients)
         })
         
-        logger.info(f"✅ Webhook #{request_count} processed successfully")
+        logger.info("✅ Webhook #%s processed successfully", request_id)
         return jsonify({
             "status": "success", 
             "message": "Webhook received",
             "broadcasted_to": len(connected_clients),
-            "request_id": request_count
+            "request_id": request_id
         }), 200
         
     except Exception as e:
-        logger.error(f"❌ Webhook #{request_count} processing error: {e}")
+        if request_id is None:
+            request_id = record_request()  # Failed before an id was assigned; still counted as a request
+        logger.error(f"❌ Webhook #{request_id} processing error: {e}")
         error_count += 1
         last_error_time = time.time()
         return jsonify({"error": str(e)}), 500
 
 @app.route('/events', methods=['GET'])
 def get_events():
-    """Get all stored events (HTTP fallback)"""
+    """Get stored events, optionally only those after ?since=<request_id> (HTTP fallback)"""
     response = jsonify({
         "total_events": len(webhook_events),
-        "events": webhook_events,
+        "events": events_since(request.args.get('since', 0, type=int)),
+        "last_request_id": request_count,
         "connected_clients": len(connected_clients),
         "last_webhook": last_webhook_time
     })
@@ -249,23 +375,24 @@ def get_events():
 @app.route('/ping', methods=['GET'])
 def ping():
     """Health check endpoint"""
-    response = jsonify({
+    response = cached_json_response('ping', lambda: {
         "pong": datetime.now().isoformat(),
         "connected_clients": len(connected_clients),
         "total_events": len(webhook_events),
         "last_webhook": last_webhook_time
     })
     response.headers['Connection'] = 'close'
-    response.headers['Content-Type'] = 'application/json'
     response.headers['Cache-Control'] = 'no-cache'
     return response
 
 @app.route('/status', methods=['GET'])
 def status_check():
     """Detailed status endpoint"""
-    global request_count, last_request_time, error_count, last_error_time
-    
-    return jsonify({
+    return cached_json_response('status', build_status)
+
+def build_status():
+    """Collect the server counters reported by /status"""
+    return {
         "server_status": "running",
         "webhook_events_count": len(webhook_events),
         "connected_clients": len(connected_clients),
@@ -277,17 +404,20 @@ def status_check():
         "last_webhook": last_webhook_time,
         "memory_usage": f"{len(webhook_events)}/{MAX_EVENTS} events",
         "uptime": "running"
-    })
+    }
 
 @app.route('/websocket-info', methods=['GET'])
 def websocket_info():
     """WebSocket connection information"""
+    # Copied under the lock; a connect during iteration would otherwise raise
+    with clients_lock:
+        clients = list(connected_clients)
+    
     return jsonify({
         "websocket_enabled": True,
-        "connected_clients": list(connected_clients),
-        "client_count": len(connected_clients),
-        "heartbeat_clients": list(client_heartbeats.keys()),
-        "server_url": f"ws://localhost:{port}"
+        "connected_clients": clients,
+        "client_count": len(clients),
+        "server_url": f"ws://{request.host}"
     })
 
 def analyze_azure_devops_event(data):
@@ -314,12 +444,8 @@ def analyze_azure_devops_event(data):
         logger.info(f"📋 Event type: {event_type}")
 
 if __name__ == '__main__':
-    # Start heartbeat monitor
-    start_heartbeat_monitor()
-    
     # Start WebSocket server
     logger.info("🚀 Starting WebSocket Webhook Server...")
-    logger.info("💓 Heartbeat monitor: Active")
     
     port = int(os.environ.get('PORT', 8001))
     logger.info(f"Starting WebSocket webhook server... Port: {port}")
@@ -327,4 +453,5 @@ if __name__ == '__main__':
     logger.info(f"WebSocket URL: ws://localhost:{port}")
     logger.info(f"Health Check: http://localhost:{port}/health")
     
+    # gevent and eventlet serve through their own WSGI servers; threading falls back to Werkzeug
     socketio.run(app, host='0.0.0.0', port=port, debug=False, allow_unsafe_werkzeug=True) 
\ No newline at end of file
@@ -10,10 +10,12 @@ import json
 import logging
 import sys
 import os
+import tempfile
 from datetime import datetime
 import threading
 import gc
-import requests
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from requests.auth import HTTPBasicAuth
 from pathlib import Path
 
@@ -27,7 +29,8 @@ load_dotenv(env_path, override=True)
 
 from src.utils.azure_client import AzureDevOpsClient
 from src.utils.security_analyzer import SecurityAnalyzer
-from src.utils.log_manager import LogManager
+from src.utils.log_manager import log_manager
+from src.utils.helpers import REQUEST_TIMEOUT, SocketIOJson, create_session, orjson
 from src.database.database import DatabaseManager
 
 # Configure logging
@@ -39,24 +42,76 @@ organization = os.getenv('AZURE_ORGANIZATION', 'your-organization')
 project = os.getenv('AZURE_PROJECT', 'your-project')
 pat = os.getenv('AZURE_PAT', 'your-personal-access-token')
 devops_server_url = os.getenv('AZURE_DEVOPS_SERVER_URL', 'https://dev.azure.com')
+repository_id = os.getenv('AZURE_REPOSITORY_ID', 'cc0db49e-774d-4dc7-b789-6fbda107c4c7')
 
 # Notifications config from environment variables
 SLACK_WEBHOOK_URL = os.getenv('SLACK_WEBHOOK_URL')
 
 # Webhook config from environment
 WEBHOOK_SERVER_URL = os.getenv('WEBHOOK_SERVER_URL', 'http://localhost:8001')
-print(f"🔧 Debug: WEBHOOK_SERVER_URL = {WEBHOOK_SERVER_URL}")
+logger.debug("🔧 WEBHOOK_SERVER_URL = %s", WEBHOOK_SERVER_URL)
+
+# Events analyzed concurrently (YAML fetch, scan, database write, Slack)
+EVENT_WORKERS = int(os.getenv('LISTENER_EVENT_WORKERS', '4'))
+
+# Reconnect backoff: base and cap in seconds, doubled per attempt and jittered by the Socket.IO client
+RECONNECT_BASE_DELAY = 5
+RECONNECT_MAX_DELAY = 60
+
+# Recently recorded (build_id, build_number) pairs remembered to skip replays without a query
+MAX_SEEN_BUILDS = 10000
+
+# Recently received server request_ids remembered to skip duplicate deliveries
+MAX_PROCESSED_EVENTS = 4096
+
+# Event types the listener acts on; others only advance the request_id cursor
+HANDLED_EVENT_TYPES = frozenset({'build.complete', 'build.started'})
+
+# Pipeline YAML file names remembered per definition revision; an edited definition gets a new revision
+MAX_DEFINITION_REVISIONS = 1024
+
+# Backup copies of analyzed pipeline YAML files
+YAML_BACKUP_DIR = Path(__file__).parent / 'logs'
+
+# Newest YAML backups kept on disk; the YAML of every build is also stored in the database
+YAML_BACKUP_MAX_FILES = int(os.getenv('YAML_BACKUP_MAX_FILES', '1000'))
+
+# Bytes written to disk per read while downloading a YAML file
+YAML_CHUNK_SIZE = 64 * 1024
+
+# Seconds Slack alerts are collected before being posted together as one message
+SLACK_ALERT_WINDOW = 2.0
+
+# Most alerts combined into one Slack message, keeping it well under Slack's message size limit
+SLACK_MAX_BATCH = 20
+
+# Seconds announcements from servers that push no payload are collected into one request_events
+REQUEST_EVENTS_DEBOUNCE = 0.25
+
+def json_body(obj):
+    """Encode obj as a UTF-8 JSON request body, using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode('utf-8')
 
 class WebSocketListener:
     def __init__(self):
-        # WebSocket client
-        self.sio = socketio.Client()
+        # WebSocket client; it reconnects by itself, retrying without limit
+        self.sio = socketio.Client(
+            reconnection=True,
+            reconnection_attempts=0,
+            reconnection_delay=RECONNECT_BASE_DELAY,
+            reconnection_delay_max=RECONNECT_MAX_DELAY,
+            randomization_factor=0.5,
+            json=SocketIOJson if orjson is not None else None
+        )
         self.websocket_url = WEBHOOK_SERVER_URL
         
         # Core components
         self.azure_client = AzureDevOpsClient()
         self.security_analyzer = SecurityAnalyzer()
-        self.log_manager = LogManager()
+        self.security_analyzer.compile_patterns()  # Compile now rather than on the first build event
+        self.log_manager = log_manager  # One handler per log file in this process
         self.db_manager = DatabaseManager()
         
         # Azure DevOps config from environment variables (for simple method)
@@ -64,12 +119,26 @@ class WebSocketListener:
         self.project = project
         self.pat = pat
         self.devops_server_url = devops_server_url
+        self.repository_id = repository_id
+        
+        # REST URL template, built once; only the file name varies per call
+        api_base = f'{self.devops_server_url}/{self.organization}/{self.project}/_apis'
+        self.items_url_template = api_base + f'/git/repositories/{self.repository_id}/items?path=/{{yaml_filename}}&api-version=6.0'
         
-        # Debug: Print environment variables
-        print(f"🔧 Debug: AZURE_ORGANIZATION = {self.organization}")
-        print(f"🔧 Debug: AZURE_PROJECT = {self.project}")
-        print(f"🔧 Debug: AZURE_PAT = {self.pat[:10]}..." if self.pat else "🔧 Debug: AZURE_PAT = None")
-        print(f"🔧 Debug: SLACK_WEBHOOK_URL = {SLACK_WEBHOOK_URL}")
+        # Pooled HTTP sessions: Azure DevOps (authenticated) and Slack
+        # Only GETs are retried, so a Slack notification is never resent
+        session_options = dict(pool_connections=4, pool_maxsize=10, backoff_factor=1, allowed_methods=['GET'])
+        self.ado_session = create_session(HTTPBasicAuth('', self.pat), **session_options)
+        self.session = create_session(**session_options)
+        
+        # Backup folder for downloaded YAML files, created once
+        YAML_BACKUP_DIR.mkdir(parents=True, exist_ok=True)
+        
+        # Debug: Log configuration (secrets only as set / not set)
+        logger.debug("🔧 AZURE_ORGANIZATION = %s", self.organization)
+        logger.debug("🔧 AZURE_PROJECT = %s", self.project)
+        logger.debug("🔧 AZURE_PAT %s", "set" if self.pat else "not set")
+        logger.debug("🔧 SLACK_WEBHOOK_URL %s", "set" if SLACK_WEBHOOK_URL else "not set")
         
         # Connection tracking
         self.connected = False
@@ -77,15 +146,33 @@ class WebSocketListener:
         self.successful_connections = 0
         self.failed_connections = 0
         self.last_event_time = time.time()
-        self.last_heartbeat_time = time.time()
         
         # Event processing
-        self.processed_events = set()
+        self.processed_events = OrderedDict()
         self.event_count = 0
+        self.last_request_id = 0  # Highest server request_id seen; only newer events are requested
+        self.events_lock = threading.Lock()
+        self.builds_in_progress = set()
+        self.seen_builds = OrderedDict()
+        self.request_pending = False  # A debounced request_events is scheduled
+        
+        # (Slack alert text, audit fields) waiting for the current SLACK_ALERT_WINDOW to close
+        self.pending_alerts = []
+        self.alert_lock = threading.Lock()
+        
+        # (definition_id, revision) -> yamlFilename, least recently used first
+        self.yaml_filenames = OrderedDict()
+        self.yaml_filenames_lock = threading.Lock()
+        self.yaml_filename_hits = 0
+        self.yaml_filename_misses = 0
+        
+        # Analysis runs off the Socket.IO thread so pings and new events are not held up
+        self.executor = ThreadPoolExecutor(max_workers=EVENT_WORKERS, thread_name_prefix='analyze')
         
         # Memory management
         self.last_cleanup_time = time.time()
         self.cleanup_interval = 300  # 5 dakika
+        self.stop_event = threading.Event()  # Set by stop() to end run()
         
         # Setup WebSocket events
         self.setup_websocket_events()
@@ -102,16 +189,12 @@ class WebSocketListener:
             self.connected = True
             self.connection_attempts += 1
             self.successful_connections += 1
-            self.last_heartbeat_time = time.time()
             
             logger.info(f"🔌 WebSocket connected! (Attempt #{self.connection_attempts})")
             logger.info(f"📡 Server: {self.websocket_url}")
             
-            # Request current events
-            self.sio.emit('request_events')
-            
-            # Start heartbeat
-            self.start_heartbeat()
+            # Request events missed while disconnected; liveness is left to Engine.IO ping/pong
+            self.request_events()
 
         @self.sio.event
         def disconnect():
@@ -120,21 +203,12 @@ class WebSocketListener:
             self.failed_connections += 1
             
             logger.warning("🔌 WebSocket disconnected!")
-            
-            # Try to reconnect
-            self.reconnect()
 
         @self.sio.on('connection_status')
         def handle_connection_status(data):
             """Handle connection status update"""
             logger.info(f"📊 Connection Status: {data}")
             
-        @self.sio.on('heartbeat_response')
-        def handle_heartbeat_response(data):
-            """Handle heartbeat response"""
-            self.last_heartbeat_time = time.time()
-            logger.debug(f"💓 Heartbeat response: {data}")
-
         @self.sio.on('events_data')
         def handle_events_data(data):
             """Handle events data from server"""
@@ -159,51 +233,63 @@ class WebSocketListener:
             # Process the event
             self.process_realtime_event(data)
 
-    def start_heartbeat(self):
-        """Start heartbeat to keep connection alive"""
-        def heartbeat_loop():
-            while self.connected:
-                try:
-                    self.sio.emit('heartbeat')
-                    time.sleep(10)  # Send heartbeat every 10 seconds
-                except Exception as e:
-                    logger.error(f"💓 Heartbeat error: {e}")
-                    break
-        
-        thread = threading.Thread(target=heartbeat_loop, daemon=True)
-        thread.start()
-        logger.info("💓 Heartbeat started")
-
-    def reconnect(self):
-        """Attempt to reconnect to WebSocket server"""
-        max_retries = 5
-        retry_delay = 5
+    def request_events(self):
+        """Ask the server for the events after the last one seen"""
+        self.sio.emit('request_events', {'since': self.last_request_id})
+
+    def schedule_request_events(self):
+        """Request events once for a burst of announcements, after REQUEST_EVENTS_DEBOUNCE"""
+        with self.events_lock:
+            if self.request_pending:
+                return
+            self.request_pending = True
         
-        for attempt in range(max_retries):
-            try:
-                logger.info(f"🔄 Reconnection attempt {attempt + 1}/{max_retries}")
-                self.sio.connect(self.websocket_url)
-                return  # Success
-            except Exception as e:
-                logger.error(f"❌ Reconnection attempt {attempt + 1} failed: {e}")
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-                    retry_delay *= 2  # Exponential backoff
+        timer = threading.Timer(REQUEST_EVENTS_DEBOUNCE, self.send_scheduled_request)
+        timer.daemon = True
+        timer.start()
+
+    def send_scheduled_request(self):
+        """Send the debounced request_events"""
+        # Cleared first: an announcement arriving from now on needs a request of its own
+        with self.events_lock:
+            self.request_pending = False
         
-        logger.error("❌ All reconnection attempts failed!")
+        try:
+            self.request_events()
+        except Exception as e:
+            logger.error(f"❌ Error requesting events: {e}")
 
     def process_event(self, event):
-        """Process a single event"""
+        """Queue a single event for processing"""
         try:
             event_id = event.get('request_id', 0)
+            event_type = event.get('event_type', 'unknown')
             
             # Skip if already processed
-            if event_id in self.processed_events:
-                return
+            with self.events_lock:
+                if isinstance(event_id, int):
+                    self.last_request_id = max(self.last_request_id, event_id)
+                if event_type not in HANDLED_EVENT_TYPES:
+                    logger.info(f"📋 Unknown event type: {event_type}")
+                    return
+                if event_id in self.processed_events:
+                    return
+                
+                self.processed_events[event_id] = None
+                if len(self.processed_events) > MAX_PROCESSED_EVENTS:
+                    self.processed_events.popitem(last=False)
+                self.event_count += 1
+                self.last_event_time = time.time()
             
-            self.processed_events.add(event_id)
-            self.event_count += 1
-            self.last_event_time = time.time()
+            self.executor.submit(self.handle_event, event)
+                
+        except Exception as e:
+            logger.error(f"❌ Error processing event: {e}")
+
+    def handle_event(self, event):
+        """Process a single event on a worker thread"""
+        try:
+            event_id = event.get('request_id', 0)
             
             # Extract event data
             event_data = event.get('data', {})
@@ -216,8 +302,6 @@ class WebSocketListener:
                 self.process_build_complete_event(event_data, event_id)
             elif event_type == 'build.started':
                 self.process_build_started_event(event_data, event_id)
-            else:
-                logger.info(f"📋 Unknown event type: {event_type}")
                 
         except Exception as e:
             logger.error(f"❌ Error processing event: {e}")
@@ -230,8 +314,12 @@ class WebSocketListener:
             
             logger.info(f"⚡ Processing real-time event: {event_type} (ID: {request_id})")
             
-            # Get full event data from server
-            self.sio.emit('request_events')
+            if 'data' in event_data:
+                # The pushed event carries its payload; process it directly
+                self.process_event(event_data)
+            else:
+                # Older servers only announce events; get full event data from server
+                self.schedule_request_events()
             
         except Exception as e:
             logger.error(f"❌ Error processing real-time event: {e}")
@@ -264,21 +352,50 @@ class WebSocketListener:
                 'raw_data': build_info
             }
             
-            # Duplicate event check
+            # Duplicate event check; a replay may be running on another worker
+            build_key = (build_id, build_number)
+            with self.events_lock:
+                if build_key in self.seen_builds:
+                    self.seen_builds.move_to_end(build_key)
+                    logger.info(f"⏭️ Duplicate event skipped: Build {build_number}")
+                    return False
+                if build_key in self.builds_in_progress:
+                    logger.info(f"⏭️ Duplicate event skipped: Build {build_number}")
+                    return False
+                self.builds_in_progress.add(build_key)
+            
+            try:
+                return self.analyze_build(event_data_for_db)
+            finally:
+                with self.events_lock:
+                    self.builds_in_progress.discard(build_key)
+            
+        except Exception as e:
+            logger.error(f"❌ Error processing build complete event: {e}")
+            
+            # Log error
+            self.log_manager.log_error('Event analysis error',
+                                 error=str(e), build_id=build_id if 'build_id' in locals() else None,
+                                 build_number=build_number if 'build_number' in locals() else None)
+            return False
+
+    def analyze_build(self, event_data_for_db):
+        """Fetch, analyze and record a build that is not yet in the database"""
+        build_id = event_data_for_db['build_id']
+        build_number = event_data_for_db['build_number']
+        definition_id = event_data_for_db['definition_id']
+        definition_name = event_data_for_db['definition_name']
+        yaml_path = None
+        
+        try:
             if self.db_manager.event_exists(build_id, build_number):
+                self.remember_build(build_id, build_number)
                 logger.info(f"⏭️ Duplicate event skipped: Build {build_number}")
                 return False
             
-            webhook_event_id = self.db_manager.save_webhook_event(event_data_for_db)
-            logger.info(f"💾 Event saved to database: ID {webhook_event_id}")
-            
-            # Log database operation
-            self.log_manager.log_audit('Webhook event saved',
-                                       event_id=webhook_event_id, build_number=build_number,
-                                       definition_name=definition_name)
-            
             # Get YAML content using simple_webhook_listener method
-            yaml_content, yaml_filename = self.get_yaml_content_simple(definition_id)
+            definition_revision = event_data_for_db['raw_data'].get('definition', {}).get('revision')
+            yaml_content, yaml_filename, yaml_path = self.get_yaml_content_simple(definition_id, definition_revision)
             if yaml_content:
                 logger.info(f"✅ YAML content received ({len(yaml_content)} characters)")
                 
@@ -286,28 +403,42 @@ class WebSocketListener:
                 security_findings = self.security_analyzer.analyze_yaml_content(yaml_content)
                 
                 if security_findings:
-                    logger.warning("🚨 SECURITY ALERT! Dangerous patterns detected:")
+                    # One record per build, listing every pattern and its count
+                    pattern_counts = {finding['pattern']: finding['count'] for finding in security_findings}
+                    logger.warning("🚨 SECURITY ALERT! Dangerous patterns detected: %s",
+                                   ", ".join(f"🔴 {pattern.upper()}: {count}" for pattern, count in pattern_counts.items()))
                     
                     # Log security alert
                     self.log_manager.log_security('WARNING', 'Dangerous patterns detected',
                                                build_id=build_id, build_number=build_number,
                                                definition_name=definition_name,
-                                               total_patterns=len(security_findings))
-                    
-                    for finding in security_findings:
-                        logger.warning(f"   🔴 {finding['pattern'].upper()}: {finding['count']} instances found")
-                        
-                        # Log each pattern in detail
-                        self.log_manager.log_security('WARNING', f"Pattern detected: {finding['pattern']}",
-                                                   pattern=finding['pattern'], count=finding['count'],
-                                                   build_id=build_id, build_number=build_number)
-                        
-                        for match in finding['matches'][:3]:  # Show first 3 matches
-                            logger.warning(f"      Example: {match[:100]}...")
-                    
-                    # Save security findings to database
-                    self.db_manager.save_security_findings(webhook_event_id, security_findings)
+                                               total_patterns=len(security_findings),
+                                               patterns=pattern_counts)
                     
+                    # Examples are stored with the findings; echo them only when debugging
+                    if logger.isEnabledFor(logging.DEBUG):
+                        for finding in security_findings:
+                            for match in finding['matches'][:3]:  # Show first 3 matches
+                                logger.debug("      %s example: %s...", finding['pattern'], match[:100])
+                else:
+                    logger.info("✅ Security analysis: No dangerous patterns detected")
+                
+                # Save event, findings and pipeline analysis in a single transaction
+                analysis = {
+                    'yaml_content': yaml_content,
+                    'yaml_filename': yaml_filename,
+                    'total_patterns': len(security_findings),
+                    'total_risk_score': sum(finding.get('risk_score', 0) for finding in security_findings)
+                }
+                webhook_event_id = self.db_manager.record_analysis(event_data_for_db, security_findings, analysis)
+                logger.info(f"💾 Event saved to database: ID {webhook_event_id}")
+                
+                # Log database operation
+                self.log_manager.log_audit('Webhook event saved',
+                                           event_id=webhook_event_id, build_number=build_number,
+                                           definition_name=definition_name)
+                
+                if security_findings:
                     # Send Slack notification
                     build_info_for_slack = {
                         'build_id': build_id,
@@ -316,50 +447,32 @@ class WebSocketListener:
                         'definition_id': definition_id
                     }
                     self.send_slack_notification_simple(build_info_for_slack, security_findings)
-                    
-                    # Log Slack notification
-                    self.log_manager.log_audit('Slack notification sent',
-                                            action='slack_notification', build_id=build_id,
-                                            build_number=build_number, definition_name=definition_name,
-                                            total_patterns=len(security_findings))
-                    
-                else:
-                    logger.info("✅ Security analysis: No dangerous patterns detected")
-                
-                # Save pipeline analysis to database
-                total_patterns = len(security_findings) if security_findings else 0
-                total_risk_score = sum(finding.get('risk_score', 0) for finding in security_findings) if security_findings else 0
-                
-                self.db_manager.save_pipeline_analysis(
-                    webhook_event_id, 
-                    yaml_content, 
-                    yaml_filename, 
-                    total_patterns, 
-                    total_risk_score
-                )
                 
-                # Mark event as processed
-                self.db_manager.update_webhook_event_processed(webhook_event_id)
-                
-                # Save YAML to logs folder (for backup)
-                import os
-                logs_dir = os.path.join(os.path.dirname(__file__), 'logs')
-                os.makedirs(logs_dir, exist_ok=True)
-                filename = os.path.join(logs_dir, f"yaml_build_{build_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.yml")
-                with open(filename, 'w', encoding='utf-8') as f:
-                    f.write(yaml_content)
+                # Keep the downloaded file in the logs folder (for backup)
+                filename = YAML_BACKUP_DIR / f"yaml_build_{build_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.yml"
+                os.replace(yaml_path, filename)
+                yaml_path = None
                 
                 logger.info(f"💾 YAML file saved: {filename}")
                 
-                # Show first 5 lines
-                lines = yaml_content.split('\n')[:5]
-                logger.info("📄 YAML Content (first 5 lines):")
-                for line in lines:
-                    logger.info(f"   {line}")
+                # Show first 5 lines (cosmetic; skipped when INFO is filtered)
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info("📄 YAML Content (first 5 lines):")
+                    for line in yaml_content.split('\n', 5)[:5]:
+                        logger.info("   %s", line)
                 
             else:
                 logger.warning("❌ Failed to get YAML content")
+                
+                webhook_event_id = self.db_manager.save_webhook_event(event_data_for_db)
+                logger.info(f"💾 Event saved to database: ID {webhook_event_id}")
+                
+                # Log database operation
+                self.log_manager.log_audit('Webhook event saved',
+                                           event_id=webhook_event_id, build_number=build_number,
+                                           definition_name=definition_name)
             
+            self.remember_build(build_id, build_number)
             return True
             
         except Exception as e:
@@ -367,9 +480,20 @@ class WebSocketListener:
             
             # Log error
             self.log_manager.log_error('Event analysis error',
-                                 error=str(e), build_id=build_id if 'build_id' in locals() else None,
-                                 build_number=build_number if 'build_number' in locals() else None)
+                                 error=str(e), build_id=build_id, build_number=build_number)
             return False
+        finally:
+            # Downloaded file that did not make it to the backup folder
+            if yaml_path:
+                Path(yaml_path).unlink(missing_ok=True)
+
+    def remember_build(self, build_id, build_number):
+        """Remember a recorded build, forgetting the least recently seen beyond MAX_SEEN_BUILDS"""
+        with self.events_lock:
+            self.seen_builds[(build_id, build_number)] = None
+            self.seen_builds.move_to_end((build_id, build_number))
+            if len(self.seen_builds) > MAX_SEEN_BUILDS:
+                self.seen_builds.popitem(last=False)
 
     def process_build_started_event(self, event_data, event_id):
         """Process build started event"""
@@ -394,35 +518,67 @@ class WebSocketListener:
         except Exception as e:
             logger.error(f"❌ Error processing build started event: {e}")
 
-    def get_yaml_content_simple(self, definition_id):
-        """Get YAML content using simple_webhook_listener method"""
+    def get_yaml_filename(self, definition_id, revision=None):
+        """Get the pipeline's YAML file name, without a request for a definition revision seen before"""
+        # A revision never changes once saved, so its file name cannot go stale
+        if revision is not None:
+            with self.yaml_filenames_lock:
+                yaml_filename = self.yaml_filenames.get((definition_id, revision))
+                if yaml_filename is not None:
+                    self.yaml_filenames.move_to_end((definition_id, revision))
+                    self.yaml_filename_hits += 1
+                    return yaml_filename
+        
+        # Unknown revision: the client revalidates the definition by ETag
+        with self.yaml_filenames_lock:
+            self.yaml_filename_misses += 1
+        definition = self.azure_client.get_pipeline_definition(definition_id)
+        if not definition:
+            return None
+        
+        yaml_filename = definition.get('process', {}).get('yamlFilename', 'azure-pipelines.yml')
+        
+        # Remembered under the revision actually fetched, which may be newer than the event's
+        fetched_revision = definition.get('revision')
+        if fetched_revision is not None:
+            with self.yaml_filenames_lock:
+                self.yaml_filenames[(definition_id, fetched_revision)] = yaml_filename
+                self.yaml_filenames.move_to_end((definition_id, fetched_revision))
+                if len(self.yaml_filenames) > MAX_DEFINITION_REVISIONS:
+                    self.yaml_filenames.popitem(last=False)
+        return yaml_filename
+
+    def get_yaml_content_simple(self, definition_id, definition_revision=None):
+        """Get YAML content using simple_webhook_listener method: (content, filename, downloaded file path)"""
+        yaml_path = None
         try:
             # First get pipeline definition
-            definition_url = f'{self.devops_server_url}/{self.organization}/{self.project}/_apis/build/definitions/{definition_id}?api-version=6.0'
-            definition_response = requests.get(definition_url, auth=HTTPBasicAuth('', self.pat))
-            
-            if definition_response.status_code != 200:
-                logger.error(f"Failed to get pipeline definition: {definition_response.status_code}")
-                return None, None
-            
-            definition_data = definition_response.json()
-            process = definition_data.get('process', {})
-            yaml_filename = process.get('yamlFilename', 'azure-pipelines.yml')
+            yaml_filename = self.get_yaml_filename(definition_id, definition_revision)
+            if not yaml_filename:
+                return None, None, None
             
             logger.info(f"📋 YAML file for Pipeline {definition_id}: {yaml_filename}")
             
             # Get YAML file
-            url = f'{self.devops_server_url}/{self.organization}/{self.project}/_apis/git/repositories/cc0db49e-774d-4dc7-b789-6fbda107c4c7/items?path=/{yaml_filename}&api-version=6.0'
-            response = requests.get(url, auth=HTTPBasicAuth('', self.pat))
-            
-            if response.status_code == 200:
-                return response.text, yaml_filename
-            else:
-                logger.error(f"Failed to get YAML file: {response.status_code} - {yaml_filename}")
-                return None, None
+            url = self.items_url_template.format(yaml_filename=yaml_filename)
+            with self.ado_session.get(url, timeout=REQUEST_TIMEOUT, stream=True) as response:
+                if response.status_code != 200:
+                    logger.error(f"Failed to get YAML file: {response.status_code} - {yaml_filename}")
+                    return None, None, None
+                
+                # Stream the body straight into the backup folder instead of buffering it
+                with tempfile.NamedTemporaryFile(dir=YAML_BACKUP_DIR, suffix='.part', delete=False) as f:
+                    yaml_path = f.name
+                    for chunk in response.iter_content(YAML_CHUNK_SIZE):
+                        f.write(chunk)
+            
+            with open(yaml_path, encoding='utf-8', errors='replace') as f:
+                return f.read(), yaml_filename, yaml_path
         except Exception as e:
             logger.error(f"YAML retrieval error: {e}")
-            return None, None
+            if yaml_path:
+                Path(yaml_path).unlink(missing_ok=True)
+            return None, None, None
 
     def get_yaml_content(self, definition_id):
         """Get YAML content from Azure DevOps"""
@@ -458,36 +614,62 @@ class WebSocketListener:
             return None, None
 
     def send_slack_notification_simple(self, build_info, findings):
-        """Send Slack notification using simple_webhook_listener method"""
+        """Queue a Slack notification using simple_webhook_listener method"""
         try:
-            # Simple Slack message
-            message = {
-                "text": f"🚨 SECURITY ALERT - Build: {build_info['build_number']} - Pipeline: {build_info['definition_name']}"
-            }
+            # Simple Slack message, joined once
+            parts = [f"🚨 SECURITY ALERT - Build: {build_info['build_number']} - Pipeline: {build_info['definition_name']}"]
             
-            # Add patterns
+            # Add patterns and total count
             if findings:
-                pattern_list = []
-                
-                # List all patterns
-                for finding in findings:
-                    pattern_name = finding['pattern']
-                    count = finding['count']
-                    pattern_list.append(f"• {pattern_name}: {count} instances")
-                
-                # Add patterns
-                message["text"] += f"\n\n🔴 Detected Patterns:\n" + "\n".join(pattern_list)
+                parts.append("\n\n🔴 Detected Patterns:\n")
+                parts.append("\n".join(f"• {finding['pattern']}: {finding['count']} instances" for finding in findings))
+                parts.append(f"\n\n📊 Summary: {len(findings)} patterns detected")
+            
+            # Audit record written once Slack accepts the post
+            audit = {
+                'action': 'slack_notification',
+                'build_id': build_info['build_id'],
+                'build_number': build_info['build_number'],
+                'definition_name': build_info['definition_name'],
+                'total_patterns': len(findings)
+            }
+            
+            # Alerts raised during a burst of builds go out together in one post
+            with self.alert_lock:
+                self.pending_alerts.append(("".join(parts), audit))
+                if len(self.pending_alerts) == 1:
+                    timer = threading.Timer(SLACK_ALERT_WINDOW, self.flush_slack_alerts)
+                    timer.daemon = True
+                    timer.start()
                 
-                # Add total count
-                total_patterns = len(findings)
-                message["text"] += f"\n\n📊 Summary: {total_patterns} patterns detected"
+        except Exception as e:
+            logger.error(f"Slack notification error: {e}")
+
+    def flush_slack_alerts(self):
+        """Post all queued Slack alerts, up to SLACK_MAX_BATCH per message"""
+        with self.alert_lock:
+            alerts, self.pending_alerts = self.pending_alerts, []
+        
+        for start in range(0, len(alerts), SLACK_MAX_BATCH):
+            self.post_slack_alerts(alerts[start:start + SLACK_MAX_BATCH])
+
+    def post_slack_alerts(self, alerts):
+        """Post (text, audit) alerts as a single Slack message"""
+        try:
+            texts = [text for text, _ in alerts]
+            if len(texts) == 1:
+                message = {"text": texts[0]}
+            else:
+                message = {"text": f"🚨 {len(texts)} builds with security alerts\n\n" + "\n\n──────────\n\n".join(texts)}
             
             # Send to Slack
             if SLACK_WEBHOOK_URL:
-                import requests
-                response = requests.post(SLACK_WEBHOOK_URL, json=message)
-                if response.status_code == 200:
+                response = self.session.post(SLACK_WEBHOOK_URL, data=json_body(message),
+                                             headers={'Content-Type': 'application/json'}, timeout=REQUEST_TIMEOUT)
+                if 200 <= response.status_code < 300:
                     logger.info("✅ Slack notification sent")
+                    for _, audit in alerts:
+                        self.log_manager.log_audit('Slack notification sent', **audit)
                 else:
                     logger.error(f"❌ Failed to send Slack notification: {response.status_code}")
             else:
@@ -536,8 +718,8 @@ class WebSocketListener:
             
             # Send to Slack
             if SLACK_WEBHOOK_URL:
-                import requests
-                response = requests.post(SLACK_WEBHOOK_URL, json=message)
+                response = self.session.post(SLACK_WEBHOOK_URL, data=json_body(message),
+                                             headers={'Content-Type': 'application/json'}, timeout=REQUEST_TIMEOUT)
                 if response.status_code == 200:
                     logger.info("✅ Slack notification sent")
                 else:
@@ -551,13 +733,7 @@ class WebSocketListener:
         try:
             current_time = time.time()
             
-            # Clean up old processed events (keep last 100)
-            if len(self.processed_events) > 100:
-                # Keep only recent events (this is simplified)
-                self.processed_events = set(list(self.processed_events)[-100:])
-            
-            # Force garbage collection
-            gc.collect()
+            self.prune_yaml_backups()
             
             self.last_cleanup_time = current_time
             logger.info("🧹 Memory cleanup performed")
@@ -565,16 +741,32 @@ class WebSocketListener:
         except Exception as e:
             logger.error(f"❌ Memory cleanup error: {e}")
 
+    def prune_yaml_backups(self):
+        """Delete the oldest YAML backups beyond YAML_BACKUP_MAX_FILES"""
+        backups = list(YAML_BACKUP_DIR.glob('yaml_build_*.yml'))
+        if len(backups) <= YAML_BACKUP_MAX_FILES:
+            return
+        
+        # File names carry the build id first, so age comes from the modification time
+        backups.sort(key=lambda path: path.stat().st_mtime)
+        for path in backups[:len(backups) - YAML_BACKUP_MAX_FILES]:
+            path.unlink(missing_ok=True)
+        logger.info(f"🧹 Removed {len(backups) - YAML_BACKUP_MAX_FILES} old YAML backups")
+
     def show_status(self):
         """Show current status"""
         logger.info("📊 WEBSOCKET LISTENER STATUS:")
         logger.info(f"   🔗 Connected: {self.connected}")
         logger.info(f"   📡 Server: {self.websocket_url}")
         logger.info(f"   📥 Events processed: {self.event_count}")
+        logger.info(f"   📋 YAML file name cache: {self.yaml_filename_hits} hits, {self.yaml_filename_misses} misses")
         logger.info(f"   🕐 Last event: {time.strftime('%H:%M:%S', time.localtime(self.last_event_time))}")
-        logger.info(f"   💓 Last heartbeat: {time.strftime('%H:%M:%S', time.localtime(self.last_heartbeat_time))}")
         logger.info(f"   🧹 Last cleanup: {time.strftime('%H:%M:%S', time.localtime(self.last_cleanup_time))}")
 
+    def stop(self):
+        """Ask run() to disconnect and return"""
+        self.stop_event.set()
+
     def run(self):
         """Main run loop"""
         try:
@@ -586,34 +778,43 @@ class WebSocketListener:
             # Main loop
             last_status_time = time.time()
             
-            while True:
+            while not self.stop_event.is_set():
                 try:
                     # Show status every 5 minutes
-                    if time.time() - last_status_time > 300:
+                    if time.time() - last_status_time >= 300:
                         self.show_status()
                         last_status_time = time.time()
                     
                     # Memory cleanup every 5 minutes
-                    if time.time() - self.last_cleanup_time > self.cleanup_interval:
+                    if time.time() - self.last_cleanup_time >= self.cleanup_interval:
                         self.cleanup_memory()
                     
-                    time.sleep(1)
+                    # Sleep until the next status or cleanup is due, or until stop() is called
+                    next_due = min(last_status_time + 300, self.last_cleanup_time + self.cleanup_interval)
+                    self.stop_event.wait(max(next_due - time.time(), 1))
                     
                 except KeyboardInterrupt:
                     logger.info("🛑 Shutting down WebSocket Listener...")
                     break
                 except Exception as e:
                     logger.error(f"❌ Main loop error: {e}")
-                    time.sleep(5)
+                    self.stop_event.wait(5)
             
             # Disconnect
             if self.connected:
                 self.sio.disconnect()
             
+            # Let queued analyses finish and send their alerts
+            self.executor.shutdown(wait=True)
+            self.flush_slack_alerts()
+            
         except Exception as e:
             logger.error(f"❌ WebSocket Listener error: {e}")
             sys.exit(1)
 
 if __name__ == '__main__':
     listener = WebSocketListener()
+    # Modules, compiled patterns and the database engine live for the whole process;
+    # move them out of the collector's generations so collections only walk per-event objects
+    gc.freeze()
     listener.run() 
\ No newline at end of file